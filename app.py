@@ -1,10 +1,26 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify, Response
-from asr import multi_asr_listen, LANG_MODELS, cleanup_unused_models, ensure_model_downloaded, get_model_progress, is_model_ready, get_model_status_info
-from recognizer import ASR
+from flask import Flask, render_template, request, redirect, url_for, jsonify, Response, stream_with_context
+from asr import multi_asr_listen, LANG_MODELS, session_models, cleanup_unused_models, ensure_model_downloaded, get_model_progress, is_model_ready, get_model_status_info, verify_installed_models, preload_models
+from recognizer import ASR, MultiASR
+from vibration import VibrationEncoder, MAX_RATE as MAX_VIBRATION_CPS
+from vocabulary import vocab_path
+from tier_policy import MODEL_TIER, TIERS
+from denoise import DENOISE_MODES
+from status_registry import subscribe as subscribe_status, unsubscribe as unsubscribe_status
+from audio_source import create_push_source, get_push_source, unregister_push_source
+from session_manager import KEEPALIVE_SECONDS, SessionLimitError, admit_session, attach_session, release_session, get_session, list_sessions
+import logging
+import math
 import os
 import time
 import threading
+import queue
 import json  # for SSE messages
+import metrics
+
+# Quiet by default; VIBERR_LOG_LEVEL=DEBUG brings back the per-request trace
+logging.basicConfig(level=os.environ.get('VIBERR_LOG_LEVEL', 'WARNING').upper(),
+                    format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
@@ -12,13 +28,35 @@ app = Flask(__name__)
 _download_threads = {}
 _thread_lock = threading.Lock()
 
+def _startup_models():
+    # Verify installed models against their manifests (and repair them) before any session loads one,
+    # then load the VIBERR_PRELOAD_LANGS models so their first session starts right away
+    verify_installed_models()
+    preload_models()
+
+startup_thread = None
+
+def start_background_startup():
+    """
+    Start model verification and preloading in the background, once per
+    process; returns the thread. Called by the entry points that serve
+    requests (app.py, asgi_app.py, prefork.py), never on import, so tools
+    that import this module do not download or load models.
+    """
+    global startup_thread
+    with _thread_lock:
+        if startup_thread is None:
+            startup_thread = threading.Thread(target=_startup_models, daemon=True, name='startup-models')
+            startup_thread.start()
+        return startup_thread
+
 @app.route('/')
 def index():
     lang = request.args.get('lang') or 'en'
     if lang not in LANG_MODELS:
         lang = 'en'
     models_in_use = lang
-    print(f"[DEBUG] / route called with lang={lang}")
+    logger.debug("/ route called with lang=%s", lang)
     # Pass model readiness to template for JS polling
     return render_template('index.html', lang=lang, models_in_use=models_in_use)
 
@@ -28,16 +66,16 @@ def listen_route():
     if lang not in LANG_MODELS:
         return jsonify({'status': 'error', 'message': 'Invalid language selected.'}), 400
 
-    print(f"[DEBUG] /listen (POST) route called for lang={lang}")
+    logger.debug("/listen (POST) route called for lang=%s", lang)
 
     status = get_model_status_info(lang)
 
     if status['status'] in ['downloading', 'extracting']:
-        print(f"[DEBUG] /listen POST - Download/extraction already in progress for {lang}")
+        logger.debug("/listen POST - Download/extraction already in progress for %s", lang)
         return jsonify(status)
 
     if status['status'] == 'ready':
-        print(f"[DEBUG] /listen POST - Model for {lang} is ready.")
+        logger.debug("/listen POST - Model for %s is ready.", lang)
         # The frontend should ideally initiate streaming directly.
         # This response is a fallback.
         return jsonify(status)
@@ -46,7 +84,7 @@ def listen_route():
     with _thread_lock:
         # Double-check inside the lock to prevent race conditions
         if lang not in _download_threads or not _download_threads[lang].is_alive():
-            print(f"[DEBUG] /listen POST - Starting background download thread for {lang}")
+            logger.debug("/listen POST - Starting background download thread for %s", lang)
             thread = threading.Thread(target=ensure_model_downloaded, args=(lang,))
             _download_threads[lang] = thread
             thread.start()
@@ -54,34 +92,174 @@ def listen_route():
             return jsonify({'status': 'download_started', 'message': f'Download started for {lang} model.'})
         else:
             # A thread was started between the outer check and acquiring the lock
-            print(f"[DEBUG] /listen POST - Download/extraction was just started for {lang}")
+            logger.debug("/listen POST - Download/extraction was just started for %s", lang)
             return jsonify(get_model_status_info(lang))
 
+def parse_stream_args(args):
+    """Validate /stream query arguments; returns an options dict, or None for a bad request."""
+    lang = args.get('lang', 'en')
+    if lang not in LANG_MODELS:
+        return None
+    # ?langs=en,es decodes the same audio in several languages at once
+    langs = [l for l in args.get('langs', '').split(',') if l]
+    if any(l not in LANG_MODELS for l in langs):
+        return None
+    # Optional override of the noise suppression stage, e.g. to compare modes
+    denoise = args.get('denoise')
+    if denoise is not None and denoise not in DENOISE_MODES:
+        return None
+    # 'server' captures the server microphone; 'client' waits for audio POSTed to /ingest
+    source_kind = args.get('source', 'server')
+    if source_kind not in ('server', 'client'):
+        return None
+    try:
+        partial_interval_ms = max(50, int(args.get('partial_ms', 250)))
+        vib_cps = float(args.get('vib_cps', 0)) or None
+    except ValueError:
+        return None
+    # float() also accepts 'nan' and 'inf', which the encoder cannot turn into frame durations
+    if vib_cps is not None and not (math.isfinite(vib_cps) and 0 < vib_cps <= MAX_VIBRATION_CPS):
+        return None
+    # vocab=<name> decodes against the phrases in data/<name>.json (single-language sessions only)
+    vocab = args.get('vocab')
+    if vocab is not None and (langs or vocab_path(vocab) is None):
+        return None
+    # nlp=1 follows each transcription with sentences, entities and cased text (single-language sessions only)
+    nlp = args.get('nlp') == '1'
+    if nlp and langs:
+        return None
+    # tier=small|large pins the model size; auto follows server load (default VIBERR_MODEL_TIER)
+    tier = args.get('tier', MODEL_TIER)
+    if tier not in ('auto',) + TIERS:
+        return None
+    return {
+        'lang': lang,
+        'langs': langs,
+        'denoise': denoise,
+        'source': source_kind,
+        # Opt-in low-latency partial hypotheses and per-word timings on final results
+        'partials': args.get('partials') == '1',
+        'partial_interval_ms': partial_interval_ms,
+        'words': args.get('words') == '1',
+        # vad=0 decodes silence too; otherwise VIBERR_VAD decides (on by default)
+        'vad': False if args.get('vad') == '0' else None,
+        # prune=0 keeps every language of a multi-language session decoding to the end
+        'prune': args.get('prune') != '0',
+        # vibrate=1 follows each English text with finger pattern frames, vib_cps characters per second
+        'vibrate': args.get('vibrate') == '1',
+        'encoder': VibrationEncoder(rate=vib_cps),
+        'vocab': vocab,
+        'nlp': nlp,
+        'tier': tier,
+    }
+
+def create_stream_recognizer(options):
+    """The ASR (or MultiASR for langs=) a /stream session runs."""
+    if options['langs']:
+        return MultiASR({l: LANG_MODELS[l] for l in options['langs']}, denoise=options['denoise'],
+                        prune=options['prune'], vad=options['vad'])
+    tiers, tier = session_models(options['lang'], options['tier'], options['vocab'])
+    return ASR(options['lang'], tiers[tier], denoise=options['denoise'],
+               partials=options['partials'], partial_interval_ms=options['partial_interval_ms'],
+               words=options['words'], vad=options['vad'], vocab=options['vocab'], nlp=options['nlp'] or None,
+               tiers=tiers)
+
+def busy_response(error):
+    """429 for a request turned away by session admission control."""
+    retry_after = max(1, int(math.ceil(error.retry_after)))
+    response = jsonify({'status': 'busy', 'message': str(error), 'retry_after': retry_after})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+def vibration_events(options, result):
+    """Vibration frames to send after a result, if the session asked for them."""
+    if not options['vibrate']:
+        return
+    # English text to feel: each translation (English results carry one too), or in
+    # multi-language sessions only the current best
+    english = result.get('best_english') if options['langs'] else result.get('translation')
+    if english:
+        yield from options['encoder'].events(english, utterance_id=result.get('utterance_id'),
+                                             lang=result.get('lang'))
+
 @app.route('/stream')
 def stream():
-    lang = request.args.get('lang', 'en')
-    if lang not in LANG_MODELS:
+    options = parse_stream_args(request.args)
+    if options is None:
         return Response(status=400)
+    lang = options['lang']
 
-    model_path = LANG_MODELS[lang]
-
-    if not is_model_ready(lang):
+    if not all(is_model_ready(l) for l in (options['langs'] or [lang])):
         def error_generate():
             yield f"data: {json.dumps({'status': 'error', 'message': 'Model not ready on disk.'})}\n\n"
         return Response(error_generate(), mimetype='text/event-stream')
 
+    try:
+        session = admit_session(options['langs'] or [lang])
+    except SessionLimitError as e:
+        return busy_response(e)
+
     def generate():
+        source = None
+        if options['source'] == 'client':
+            _, source = create_push_source(session.id)
         try:
-            asr = ASR(lang, model_path)
-            for result in asr.recognize_stream():
+            asr = create_stream_recognizer(options)
+            attach_session(session, asr)
+            for result in asr.recognize_stream(source, keepalive_seconds=KEEPALIVE_SECONDS):
+                if result.get('keepalive'):
+                    # Listening without speech: a failed write here ends a vanished client's session
+                    yield ": keepalive\n\n"
+                    session.touch()
+                    continue
+                if result.get('status') == 'ready_and_listening':
+                    # The ID lets the client /terminate this session (and only this one)
+                    result['session_id'] = session.id
+                    if source is not None:
+                        # Tell the client where to send its audio
+                        result['ingest_url'] = url_for('ingest_route', session_id=session.id)
                 yield f"data: {json.dumps(result)}\n\n"
+                for event in vibration_events(options, result):
+                    yield f"data: {json.dumps(event)}\n\n"
+                session.touch(events=1)
         except Exception as e:
-            print(f"[ERROR] /stream: Failed to initialize or run ASR for lang={lang}. Error: {e}")
+            logger.exception("/stream: Failed to initialize or run ASR for lang=%s. Error: %s", lang, e)
             yield f"data: {json.dumps({'status': 'error', 'message': 'Failed to start recognition stream.'})}\n\n"
         finally:
-            print(f"[DEBUG] /stream generate() for {lang} finished.")
+            if source is not None:
+                unregister_push_source(session.id)
+            release_session(session)
+            logger.debug("/stream generate() for %s finished.", lang)
 
-    return Response(generate(), mimetype='text/event-stream')
+    # Request context is kept so the ready event can build the ingest URL
+    return Response(stream_with_context(generate()), mimetype='text/event-stream')
+
+@app.route('/ingest/<session_id>', methods=['POST'])
+def ingest_route(session_id):
+    """
+    Receive 16 kHz mono int16 PCM for a client-fed /stream session. The body
+    may be sent in one piece per chunk or as a long-lived chunked upload;
+    pass ?end=1 on the last request to finish the utterance stream.
+    """
+    source = get_push_source(session_id)
+    if source is None:
+        return jsonify({'status': 'error', 'message': 'Unknown or finished session.'}), 404
+    session = get_session(session_id)
+    accepted = True
+    while accepted:
+        chunk = request.stream.read(8192)
+        if not chunk:
+            break
+        accepted = source.push(chunk)
+        if session is not None:
+            # Incoming audio keeps the session from being reaped as idle
+            session.touch(audio_bytes=len(chunk))
+    if request.args.get('end') == '1':
+        source.end()
+    if not accepted:
+        return jsonify({'status': 'error', 'message': 'Session is no longer accepting audio.'}), 410
+    return jsonify({'status': 'ok', 'received_bytes': source.received_bytes, 'dropped_bytes': source.dropped_bytes})
 
 @app.route('/recognize', methods=['POST'])
 def recognize_route():
@@ -90,9 +268,17 @@ def recognize_route():
     if not is_model_ready(lang):
         return "Model not ready. Please go back and wait for the download to complete.", 400
 
-    print(f"[DEBUG] /recognize route POST - Model ready for {lang}, starting recognition")
-    cleanup_unused_models(lang)
-    result = multi_asr_listen([lang])
+    logger.debug("/recognize route POST - Model ready for %s, starting recognition", lang)
+    # Replaces the caller's own earlier session, if it names one; other sessions keep running
+    cleanup_unused_models(request.form.get('session_id'))
+    try:
+        session = admit_session([lang], kind='recognize')
+    except SessionLimitError as e:
+        return busy_response(e)
+    try:
+        result = multi_asr_listen([lang], session=session)
+    finally:
+        release_session(session)
     # Get both original and translated results
     orig, trans = result['all_results'][lang]
     # Return both transcription and translation as JSON object
@@ -111,12 +297,19 @@ def model_progress_route():
 
 @app.route('/terminate', methods=['POST'])
 def terminate_instance():
-    print('[DEBUG] /terminate route called - cleaning up all models and resources')
-    # Clean up all models/resources (pass None or suitable arg to cleanup_unused_models)
-    cleanup_unused_models(None)
-    # Optionally, stop any ongoing downloads or loading tasks here if implemented
-    # Optionally, set a global flag or state to indicate termination if needed
-    return jsonify({'status': 'terminated', 'message': 'Instance terminated and loading stopped.'})
+    """Terminate the caller's own session, named by session_id (form field, query or JSON body)."""
+    session_id = request.values.get('session_id') or (request.get_json(silent=True) or {}).get('session_id')
+    logger.debug('/terminate route called for session_id=%s', session_id)
+    if not session_id:
+        return jsonify({'status': 'error', 'message': 'session_id is required.'}), 400
+    if not cleanup_unused_models(session_id):
+        return jsonify({'status': 'error', 'message': 'Unknown or finished session.'}), 404
+    return jsonify({'status': 'terminated', 'session_id': session_id, 'message': 'Session terminated.'})
+
+@app.route('/sessions')
+def sessions_route():
+    """Running sessions with their languages, age, idle time and resource usage."""
+    return jsonify({'sessions': list_sessions()})
 
 @app.route('/model_status')
 def model_status_route():
@@ -126,5 +319,45 @@ def model_status_route():
     status = get_model_status_info(lang)
     return jsonify(status)
 
+@app.route('/status_events')
+def status_events_route():
+    """
+    SSE channel of model status changes (download/extraction progress, model
+    load/unload). Optional ?lang= limits it to one language. Each event has
+    the same fields as /model_status plus 'lang'.
+    """
+    lang_filter = request.args.get('lang')
+    if lang_filter is not None and lang_filter not in LANG_MODELS:
+        return Response(status=400)
+    langs = [lang_filter] if lang_filter else list(LANG_MODELS)
+
+    def generate():
+        q = subscribe_status()
+        try:
+            # Current state first, then only changes
+            for lang in langs:
+                yield f"data: {json.dumps(dict(get_model_status_info(lang), lang=lang))}\n\n"
+            while True:
+                try:
+                    lang = q.get(timeout=15)
+                except queue.Empty:
+                    # Keeps proxies from closing the connection and detects gone clients
+                    yield ": keepalive\n\n"
+                    continue
+                if lang in langs:
+                    yield f"data: {json.dumps(dict(get_model_status_info(lang), lang=lang))}\n\n"
+        finally:
+            unsubscribe_status(q)
+
+    return Response(generate(), mimetype='text/event-stream')
+
+@app.route('/metrics')
+def metrics_route():
+    """Prometheus scrape endpoint."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
+    # debug=True runs the server in a reloader child; the watching parent must not load models
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_startup()
     app.run(debug=True)
@@ -0,0 +1,484 @@
+"""
+Asyncio (ASGI) serving mode for the streaming endpoints.
+
+Under Flask every /stream session holds an OS thread for its whole life,
+mostly blocked waiting for audio. Here the event loop owns the sessions:
+
+- Client-fed single-language sessions never block a thread while waiting.
+  Audio POSTed to /ingest lands in an in-loop buffer, and each chunk is
+  decoded with ASR.feed() on a bounded executor (VIBERR_DECODE_WORKERS),
+  so threads are only busy while there is decode work.
+- Sessions that need a blocking source (server microphone, multi-language)
+  run their pull loop on a thread of their own, so a long-lived session
+  never waits for a pool thread held by another. Admission limits in
+  session_manager bound how many there are.
+- Shorter blocking calls (model loading, status checks, the Flask routes)
+  share a bounded pool of VIBERR_BLOCKING_WORKERS threads, apart from the
+  decode pool.
+- Backpressure: events go to the client through a bounded queue. When it is
+  full, partial hypotheses are dropped (a newer one follows) and anything
+  else waits. While the session waits, buffered audio is capped and its
+  oldest part dropped and counted.
+- A keepalive comment goes out every HEARTBEAT_SECONDS, and the request's
+  receive channel is watched for http.disconnect, so a vanished client's
+  session is torn down at once.
+
+/stream, /ingest, /status_events and /metrics are served natively. Every
+other route is forwarded to the Flask app in app.py on the executor.
+
+Run with `python asgi_app.py [--host 0.0.0.0] [--port 8000]` or
+`uvicorn asgi_app:app`. uvicorn is optional (not in requirements.txt) and
+only needed for this mode.
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import queue
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+from app import app as flask_app, start_background_startup, parse_stream_args, create_stream_recognizer, vibration_events
+from asr import LANG_MODELS, is_model_ready, get_model_status_info
+from audio_source import SAMPLE_RATE, create_push_source, get_push_source, unregister_push_source
+from recognizer import ASR
+from session_manager import (KEEPALIVE_SECONDS, QUEUE_SECONDS, SessionLimitError, admit_session, attach_session, get_session,
+                             has_capacity, release_session)
+from status_registry import subscribe as subscribe_status, unsubscribe as unsubscribe_status
+import metrics
+
+logger = logging.getLogger(__name__)
+
+DECODE_WORKERS = int(os.environ.get('VIBERR_DECODE_WORKERS', str(os.cpu_count() or 4)))
+BLOCKING_WORKERS = int(os.environ.get('VIBERR_BLOCKING_WORKERS', '16'))
+HEARTBEAT_SECONDS = 15.0
+MAX_BUFFERED_SECONDS = 10.0
+MAX_PENDING_EVENTS = 256
+# How often an idle session checks for finished translations
+POLL_SECONDS = 0.25
+
+_decode_pool = ThreadPoolExecutor(max_workers=DECODE_WORKERS, thread_name_prefix='decode')
+_blocking_pool = ThreadPoolExecutor(max_workers=BLOCKING_WORKERS, thread_name_prefix='blocking')
+
+# session_id -> _AudioBuffer for sessions decoded with ASR.feed()
+_feed_sessions = {}
+
+ASGI_SESSIONS = metrics.Gauge('viberr_asgi_sessions', 'Streaming sessions open on the ASGI server.')
+DROPPED_EVENTS = metrics.Counter('viberr_dropped_events_total',
+                                 'Partial events dropped because the client was reading too slowly.')
+
+class _AudioBuffer:
+    """Client audio for one session, owned by the event loop. Oldest audio is dropped past the cap."""
+
+    def __init__(self, max_buffered_seconds=MAX_BUFFERED_SECONDS):
+        self.max_bytes = int(max_buffered_seconds * SAMPLE_RATE) * 2
+        self.received_bytes = 0
+        self.dropped_bytes = 0
+        self.ended = False
+        self._buffer = bytearray()
+        self._ready = asyncio.Event()
+
+    def push(self, data):
+        if self.ended:
+            return False
+        self._buffer.extend(data)
+        self.received_bytes += len(data)
+        excess = len(self._buffer) - self.max_bytes
+        if excess > 0:
+            excess += excess % 2  # keep sample alignment
+            del self._buffer[:excess]
+            self.dropped_bytes += excess
+            metrics.AUDIO_OVERFLOWS.inc(source='asgi')
+            metrics.AUDIO_DROPPED_BYTES.inc(excess, source='asgi')
+        self._ready.set()
+        return True
+
+    def end(self):
+        self.ended = True
+        self._ready.set()
+
+    async def take(self, n_bytes, timeout):
+        """Up to n_bytes of audio; b'' once ended and drained; None if nothing arrived in time."""
+        while len(self._buffer) < n_bytes and not self.ended:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        take = min(n_bytes, len(self._buffer))
+        take -= take % 2
+        data = bytes(self._buffer[:take])
+        del self._buffer[:take]
+        return data
+
+# -- plumbing ---------------------------------------------------------------------
+
+def _query(scope):
+    return dict(parse_qsl(scope.get('query_string', b'').decode('latin-1')))
+
+async def _send_json(send, status, payload, headers=()):
+    body = json.dumps(payload).encode('utf-8')
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+                + list(headers)})
+    await send({'type': 'http.response.body', 'body': body})
+
+async def _send_text(send, status, text, content_type=b'text/plain; charset=utf-8'):
+    body = text.encode('utf-8')
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', content_type), (b'content-length', str(len(body)).encode())]})
+    await send({'type': 'http.response.body', 'body': body})
+
+async def _start_sse(send):
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': [(b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache'),
+                            (b'x-accel-buffering', b'no')]})
+
+async def _watch_disconnect(receive, disconnected):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            disconnected.set()
+            return
+
+class _EventWriter:
+    """Bounded outbound queue drained by one task: backpressure, partial dropping and heartbeats."""
+
+    def __init__(self, send, disconnected):
+        self.send = send
+        self.disconnected = disconnected
+        self.queue = asyncio.Queue(maxsize=MAX_PENDING_EVENTS)
+        self.task = asyncio.ensure_future(self._run())
+
+    async def put(self, event):
+        if self.queue.full() and 'partial' in event:
+            DROPPED_EVENTS.inc()
+            return
+        await self.queue.put(f"data: {json.dumps(event)}\n\n".encode('utf-8'))
+
+    async def close(self):
+        await self.queue.put(None)
+        await self.task
+
+    async def _run(self):
+        # Keeps draining after a disconnect so put() never blocks on a dead client
+        while True:
+            try:
+                chunk = await asyncio.wait_for(self.queue.get(), HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                chunk = b": keepalive\n\n"
+            if chunk is None:
+                return
+            if self.disconnected.is_set():
+                continue
+            try:
+                await self.send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            except Exception as e:
+                logger.debug("SSE send failed, treating client as gone: %s", e)
+                self.disconnected.set()
+
+# -- /stream ------------------------------------------------------------------------
+
+async def _admit(langs):
+    """session_manager.admit_session without parking a thread while the request waits for a slot."""
+    deadline = time.monotonic() + QUEUE_SECONDS
+    while not has_capacity(langs) and time.monotonic() < deadline:
+        await asyncio.sleep(POLL_SECONDS)
+    return admit_session(langs, wait=0)
+
+async def _run_feed_session(asr, session, audio, writer, disconnected, options):
+    """Decode client audio chunk by chunk; no thread is held while waiting for audio."""
+    loop = asyncio.get_running_loop()
+    chunk_bytes = asr.chunk_size * 2
+    finished = False
+    try:
+        while not disconnected.is_set() and not session.terminated:
+            data = await audio.take(chunk_bytes, POLL_SECONDS)
+            if data is None:
+                events = asr.poll()  # Never blocks: only translations that already finished
+            elif data == b'':
+                events = await loop.run_in_executor(_decode_pool, asr.finish)
+                finished = True
+            else:
+                events = await loop.run_in_executor(_decode_pool, asr.feed, data)
+            for event in events:
+                await writer.put(event)
+                for vibration in vibration_events(options, event):
+                    await writer.put(vibration)
+            if events:
+                session.touch(events=len(events))
+            if finished:
+                return
+    finally:
+        if not finished:
+            asr.close()
+
+async def _run_blocking_session(asr, session, source, writer, disconnected, options, ready_extra):
+    """Drive a pull-style recognize_stream on the session's own thread, one event at a time."""
+    loop = asyncio.get_running_loop()
+    # One thread per session: the generator blocks on audio for the session's whole life
+    thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'session-{session.id[:8]}')
+    events = asr.recognize_stream(source, keepalive_seconds=KEEPALIVE_SECONDS)
+    done = object()
+    exhausted = False
+    gone = asyncio.ensure_future(disconnected.wait())
+    try:
+        while True:
+            pending = loop.run_in_executor(thread, next, events, done)
+            await asyncio.wait([pending, gone], return_when=asyncio.FIRST_COMPLETED)
+            if not pending.done():
+                # Client left while the loop waits for audio: wake its read() so it returns
+                asr.terminate()
+            event = await pending
+            if event is done:
+                exhausted = True
+                return
+            if disconnected.is_set():
+                return
+            if event.get('keepalive'):
+                # The writer sends its own heartbeats; this only records that the session is listening
+                session.touch()
+                continue
+            if event.get('status') == 'ready_and_listening':
+                event.update(ready_extra)
+            await writer.put(event)
+            for vibration in vibration_events(options, event):
+                await writer.put(vibration)
+            session.touch(events=1)
+    finally:
+        gone.cancel()
+        if not exhausted:
+            asr.terminate()
+            # Runs the generator's cleanup: closes the source and releases the model
+            await loop.run_in_executor(thread, events.close)
+        thread.shutdown(wait=False)
+
+async def stream(scope, receive, send):
+    options = parse_stream_args(_query(scope))
+    if options is None:
+        await _send_text(send, 400, 'Bad request')
+        return
+    loop = asyncio.get_running_loop()
+    langs = options['langs'] or [options['lang']]
+    ready = await loop.run_in_executor(_blocking_pool, lambda: all(is_model_ready(l) for l in langs))
+    session = None
+    if ready:
+        try:
+            session = await _admit(langs)
+        except SessionLimitError as e:
+            retry_after = max(1, int(e.retry_after))
+            await _send_json(send, 429, {'status': 'busy', 'message': str(e), 'retry_after': retry_after},
+                             [(b'retry-after', str(retry_after).encode())])
+            return
+    await _start_sse(send)
+    disconnected = asyncio.Event()
+    watcher = asyncio.ensure_future(_watch_disconnect(receive, disconnected))
+    writer = _EventWriter(send, disconnected)
+    ASGI_SESSIONS.inc()
+    try:
+        if not ready:
+            await writer.put({'status': 'error', 'message': 'Model not ready on disk.'})
+            return
+        try:
+            asr = await loop.run_in_executor(_blocking_pool, create_stream_recognizer, options)
+        except Exception as e:
+            logger.exception("ASGI /stream: Failed to initialize ASR for lang=%s. Error: %s", options['lang'], e)
+            await writer.put({'status': 'error', 'message': 'Failed to start recognition stream.'})
+            return
+        attach_session(session, asr)
+        ready_extra = {'session_id': session.id}
+        if options['source'] == 'client':
+            ready_extra['ingest_url'] = scope.get('root_path', '') + '/ingest/' + session.id
+        if options['source'] == 'client' and isinstance(asr, ASR):
+            audio = _AudioBuffer()
+            _feed_sessions[session.id] = audio
+            await writer.put(dict(asr.ready_event(), **ready_extra))
+            await _run_feed_session(asr, session, audio, writer, disconnected, options)
+        else:
+            source = None
+            if options['source'] == 'client':
+                _, source = create_push_source(session.id)
+            try:
+                await _run_blocking_session(asr, session, source, writer, disconnected, options, ready_extra)
+            finally:
+                if source is not None:
+                    unregister_push_source(session.id)
+    finally:
+        ASGI_SESSIONS.dec()
+        if session is not None:
+            _feed_sessions.pop(session.id, None)
+            release_session(session)
+        await writer.close()
+        watcher.cancel()
+        if not disconnected.is_set():
+            await send({'type': 'http.response.body', 'body': b''})
+        logger.debug("ASGI /stream session for %s finished", options['lang'])
+
+# -- /ingest ------------------------------------------------------------------------
+
+async def ingest(scope, receive, send, session_id):
+    audio = _feed_sessions.get(session_id)
+    source = None if audio is not None else get_push_source(session_id)
+    target = audio or source
+    if target is None:
+        await _send_json(send, 404, {'status': 'error', 'message': 'Unknown or finished session.'})
+        return
+    session = get_session(session_id)
+    accepted = True
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+        more_body = message.get('more_body', False)
+        if accepted and message.get('body'):
+            # Both push() implementations only append under a short lock
+            accepted = target.push(message['body'])
+            if session is not None:
+                session.touch(audio_bytes=len(message['body']))
+    if _query(scope).get('end') == '1':
+        target.end()
+    if not accepted:
+        await _send_json(send, 410, {'status': 'error', 'message': 'Session is no longer accepting audio.'})
+        return
+    await _send_json(send, 200, {'status': 'ok', 'received_bytes': target.received_bytes,
+                                 'dropped_bytes': target.dropped_bytes})
+
+# -- /status_events -----------------------------------------------------------------
+
+async def status_events(scope, receive, send):
+    lang_filter = _query(scope).get('lang')
+    if lang_filter is not None and lang_filter not in LANG_MODELS:
+        await _send_text(send, 400, 'Bad request')
+        return
+    langs = [lang_filter] if lang_filter else list(LANG_MODELS)
+    loop = asyncio.get_running_loop()
+    await _start_sse(send)
+    disconnected = asyncio.Event()
+    watcher = asyncio.ensure_future(_watch_disconnect(receive, disconnected))
+    writer = _EventWriter(send, disconnected)
+    q = subscribe_status()
+    try:
+        for lang in langs:
+            info = await loop.run_in_executor(_blocking_pool, get_model_status_info, lang)
+            await writer.put(dict(info, lang=lang))
+        while not disconnected.is_set():
+            try:
+                lang = q.get_nowait()
+            except queue.Empty:
+                # The registry queue is thread-based; a short poll keeps no thread parked on it
+                await asyncio.sleep(POLL_SECONDS)
+                continue
+            if lang in langs:
+                info = await loop.run_in_executor(_blocking_pool, get_model_status_info, lang)
+                await writer.put(dict(info, lang=lang))
+    finally:
+        unsubscribe_status(q)
+        await writer.close()
+        watcher.cancel()
+
+# -- everything else: the Flask app ---------------------------------------------------
+
+def _call_wsgi(scope, body):
+    """Run one request through the Flask app; returns (status, headers, body)."""
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        key = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if key == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif key != 'CONTENT_LENGTH':
+            environ[f'HTTP_{key}'] = environ[f'HTTP_{key}'] + ',' + value if f'HTTP_{key}' in environ else value
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = headers
+        return lambda data: None
+
+    result = flask_app(environ, start_response)
+    try:
+        payload = b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return response['status'], response['headers'], payload
+
+async def forward_to_flask(scope, receive, send):
+    chunks = []
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+        chunks.append(message.get('body', b''))
+        more_body = message.get('more_body', False)
+    loop = asyncio.get_running_loop()
+    # Some routes (e.g. /recognize) hold the request for a whole session
+    status, headers, body = await loop.run_in_executor(_blocking_pool, _call_wsgi, scope, b''.join(chunks))
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]})
+    await send({'type': 'http.response.body', 'body': body})
+
+# -- entry point ------------------------------------------------------------------------
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                start_background_startup()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                _decode_pool.shutdown(wait=False)
+                _blocking_pool.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    if scope['type'] != 'http':
+        return
+    path, method = scope['path'], scope['method']
+    if path == '/stream' and method == 'GET':
+        await stream(scope, receive, send)
+    elif path.startswith('/ingest/') and method == 'POST':
+        await ingest(scope, receive, send, path[len('/ingest/'):])
+    elif path == '/status_events' and method == 'GET':
+        await status_events(scope, receive, send)
+    elif path == '/metrics' and method == 'GET':
+        await _send_text(send, 200, metrics.render(), b'text/plain; version=0.0.4')
+    else:
+        await forward_to_flask(scope, receive, send)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve Viberr with asyncio (ASGI) streaming.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args(argv)
+    try:
+        import uvicorn
+    except ImportError:
+        sys.exit("ASGI mode needs uvicorn: pip install uvicorn")
+    uvicorn.run(app, host=args.host, port=args.port, log_level=os.environ.get('VIBERR_LOG_LEVEL', 'warning').lower())
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,19 @@
-import json
-import spacy
-import pyaudio
-import noisereduce as nr
-import numpy as np
+import logging
 import os
-import requests
-import zipfile
-from googletrans import Translator
 import threading
-import subprocess
+import shutil
+from contextlib import contextmanager
+from downloader import download_and_extract
+from model_cache import acquire_model, is_lang_loaded
+from model_manifest import verify_model, verify_models, invalidate as invalidate_manifest, VERIFIED, UNVERIFIED, CORRUPT
+from status_registry import publish as publish_status, cached_readiness, invalidate_readiness, shared_state
 from translate_util import translate_to_english
-from recognizer import ASR, register_asr_instance, unregister_asr_instance, terminate_all_asr_instances
+from recognizer import ASR, MultiASR, register_asr_instance, unregister_asr_instance
+from session_manager import KEEPALIVE_SECONDS, attach_session, terminate_session
+from tier_policy import TIERS, choose_tier
+from vocabulary import supports_grammar
+
+logger = logging.getLogger(__name__)
 
 LANG_MODELS = {
     'en': 'models/vosk-model-en-us-0.42-gigaspeech',
@@ -25,6 +28,27 @@ LANG_MODELS = {
     'it': 'models/vosk-model-it-0.22',
 }
 
+# Small models: several times faster and lighter, less accurate. Used under load (see tier_policy.py)
+# and for grammar-constrained sessions, which need their runtime-composed graph (see vocabulary.py)
+SMALL_LANG_MODELS = {
+    'en': 'models/vosk-model-small-en-us-0.15',
+    'hi': 'models/vosk-model-small-hi-0.22',
+    'zh': 'models/vosk-model-small-cn-0.22',
+    'ru': 'models/vosk-model-small-ru-0.22',
+    'fr': 'models/vosk-model-small-fr-0.22',
+    'de': 'models/vosk-model-small-de-0.15',
+    'es': 'models/vosk-model-small-es-0.42',
+    'pt': 'models/vosk-model-small-pt-0.3',
+    'ja': 'models/vosk-model-small-ja-0.22',
+    'it': 'models/vosk-model-small-it-0.22',
+}
+
+# tier -> lang -> model folder
+MODEL_TIERS = {
+    'large': LANG_MODELS,
+    'small': SMALL_LANG_MODELS,
+}
+
 NLP_MODELS = {
     'en': 'en_core_web_sm',
     'hi': 'xx_ent_wiki_sm',  
@@ -51,8 +75,32 @@ MODEL_URLS = {
     # English is always present locally
 }
 
+SMALL_MODEL_URLS = {
+    lang: f'https://alphacephei.com/vosk/models/{os.path.basename(path)}.zip'
+    for lang, path in SMALL_LANG_MODELS.items()
+}
+
+TIER_URLS = {
+    'large': MODEL_URLS,
+    'small': SMALL_MODEL_URLS,
+}
+
+# Known-good SHA-256 digests of model archives, checked after download when present
+# (keyed like progress: 'fr' for the large tier, 'fr:small' for others)
+MODEL_SHA256 = {}
+# Parallel range requests per model download
+DOWNLOAD_WORKERS = int(os.environ.get('VIBERR_DOWNLOAD_WORKERS', '4'))
+
+# Languages whose models are loaded in the background at server start, e.g. VIBERR_PRELOAD_LANGS=en,fr
+PRELOAD_LANGS = [lang.strip() for lang in os.environ.get('VIBERR_PRELOAD_LANGS', '').split(',') if lang.strip()]
+
 # Progress tracking for model downloads
 _model_progress = {}
+# Background repair downloads started at startup (prefork waits for them before forking)
+_repair_threads = []
+_repair_lock = threading.Lock()
+# lang -> 'queued', 'loading', 'loaded' or 'failed' for languages in the preload list
+_preload_state = {}
 # Track recently loaded models for showing alerts
 _recently_loaded_models = set()
 _recently_loaded_lock = threading.Lock()
@@ -61,19 +109,51 @@ def signal_model_loaded(lang):
     """Signal that a model has just finished loading into memory."""
     with _recently_loaded_lock:
         _recently_loaded_models.add(lang)
-        print(f"[DEBUG] Model {lang} signaled as just loaded")
+        logger.debug("Model %s signaled as just loaded", lang)
+    publish_status(lang)
 
 def check_and_clear_model_loaded(lang):
     """Check if a model was recently loaded and clear the flag."""
     with _recently_loaded_lock:
         if lang in _recently_loaded_models:
             _recently_loaded_models.remove(lang)
-            print(f"[DEBUG] Model {lang} just-loaded flag cleared")
+            logger.debug("Model %s just-loaded flag cleared", lang)
             return True
         return False
 
-def get_model_progress(lang):
-    return _model_progress.get(lang, {"status": "idle", "progress": 0})
+def _tier_key(lang, tier):
+    """Key for per-model state: the language for the large tier, 'fr:small' for the others."""
+    return lang if tier == 'large' else f'{lang}:{tier}'
+
+def set_model_progress(lang, progress, tier='large'):
+    """Update download/extraction progress and push it to status subscribers."""
+    key = _tier_key(lang, tier)
+    _model_progress[key] = progress
+    if key != lang:
+        invalidate_readiness(key, progress)
+        publish_status(lang)
+    else:
+        publish_status(lang, progress)
+
+def get_model_progress(lang, tier='large'):
+    key = _tier_key(lang, tier)
+    # Under prefork the download may be running in another worker
+    return shared_state(key) or _model_progress.get(key, {"status": "idle", "progress": 0})
+
+@contextmanager
+def _download_lock(path):
+    """Hold an exclusive lock on path (created if needed) across processes, where flock exists."""
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
 
 def safe_remove(path, retries=5, delay=0.2):
     import time
@@ -87,137 +167,204 @@ def safe_remove(path, retries=5, delay=0.2):
                 raise
             time.sleep(delay)
 
-def ensure_model_downloaded(lang):
-    if lang == 'en':
+def ensure_model_downloaded(lang, tier='large'):
+    """
+    Download and extract the model for lang (in the given tier) if it is not
+    on disk yet. Interrupted downloads resume where they stopped (see
+    downloader.py).
+    """
+    if lang == 'en' and tier == 'large':
         return  # English model is always present
-    model_path = LANG_MODELS[lang]
-    zip_path = f"{model_path}.zip"
+    model_path = MODEL_TIERS[tier][lang]
     os.makedirs(os.path.dirname(model_path), exist_ok=True)
-    def download_zip():
-        url = MODEL_URLS[lang]
-        with requests.get(url, stream=True) as r:
-            r.raise_for_status()
-            total = int(r.headers.get('content-length', 0))
-            downloaded = 0
-            _model_progress[lang] = {"status": "downloading", "progress": 0}
-            with open(zip_path, 'wb') as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-                        downloaded += len(chunk)
-                        percent = int(downloaded * 100 / total) if total else 0
-                        _model_progress[lang] = {"status": "downloading", "progress": percent}
-            _model_progress[lang] = {"status": "downloaded", "progress": 100}
-    extracted = False
-    if not os.path.exists(model_path) and os.path.exists(zip_path):
-        try:
-            _model_progress[lang] = {"status": "extracting", "progress": 0}
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall("models")
-            _model_progress[lang] = {"status": "ready", "progress": 100}
-            extracted = True
-        except Exception as e:
-            print(f"Error extracting model zip for '{lang}': {e}. Retrying download...")
-            try:
-                safe_remove(zip_path)
-            except Exception as e_rm:
-                print(f"Failed to remove zip after extraction error: {e_rm}")
-            download_zip()
-            try:
-                _model_progress[lang] = {"status": "extracting", "progress": 0}
-                with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                    zip_ref.extractall("models")
-                _model_progress[lang] = {"status": "ready", "progress": 100}
-                extracted = True
-            except Exception as e2:
-                print(f"Failed again to extract model zip for '{lang}': {e2}")
-            finally:
-                try:
-                    safe_remove(zip_path)
-                except Exception as e_rm:
-                    print(f"Failed to remove zip after second extraction error: {e_rm}")
-        print('models directory after extraction:', os.listdir('models'))
-    if not os.path.exists(model_path) and not extracted:
-        print(f"Model for '{lang}' not found. Downloading...")
-        download_zip()
-        try:
-            _model_progress[lang] = {"status": "extracting", "progress": 0}
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall("models")
-            _model_progress[lang] = {"status": "ready", "progress": 100}
-        except Exception as e:
-            print(f"Error extracting downloaded model zip for '{lang}': {e}")
-        finally:
-            try:
-                safe_remove(zip_path)
-            except Exception as e_rm:
-                print(f"Failed to remove zip after download extraction error: {e_rm}")
-        print('models directory after extraction:', os.listdir('models'))
-    else:
+    # Another thread or worker may be fetching the same model into the same .part file: wait for it,
+    # then the checks below find the finished model instead of downloading it again
+    with _download_lock(f"{model_path}.lock"):
+        _ensure_model_downloaded(lang, tier, model_path)
+
+def _ensure_model_downloaded(lang, tier, model_path):
+    zip_path = f"{model_path}.zip"
+    if os.path.exists(model_path) and not is_model_ready(lang, tier):
+        # Partial or corrupt install: discard it and fetch again
+        logger.warning("Model for '%s' (%s) failed verification; re-downloading.", lang, tier)
+        shutil.rmtree(model_path, ignore_errors=True)
+        invalidate_manifest(model_path)
+    if os.path.exists(model_path):
         if os.path.exists(zip_path):
             try:
                 safe_remove(zip_path)
             except Exception as e_rm:
-                print(f"Failed to remove zip after model already exists: {e_rm}")
-        _model_progress[lang] = {"status": "ready", "progress": 100}
-        print(f"Model for '{lang}' already exists.")
+                logger.warning("Failed to remove zip after model already exists: %s", e_rm)
+        set_model_progress(lang, {"status": "ready", "progress": 100}, tier)
+        logger.debug("Model for '%s' (%s) already exists.", lang, tier)
+        return
 
-def cleanup_unused_models(current_lang):
+    def report(status, percent, done, total):
+        progress = {"status": status, "progress": percent}
+        if status == 'downloading':
+            progress.update(downloaded_bytes=done, total_bytes=total)
+        set_model_progress(lang, progress, tier)
+
+    logger.info("Model for '%s' (%s) not found. Downloading...", lang, tier)
+    set_model_progress(lang, {"status": "downloading", "progress": 0}, tier)
+    try:
+        download_and_extract(TIER_URLS[tier][lang], zip_path, os.path.dirname(model_path), progress=report,
+                             workers=DOWNLOAD_WORKERS, expected_sha256=MODEL_SHA256.get(_tier_key(lang, tier)))
+        set_model_progress(lang, {"status": "ready", "progress": 100}, tier)
+    except Exception as e:
+        logger.error("Error downloading model for '%s' (%s): %s", lang, tier, e)
+        set_model_progress(lang, {"status": "error", "progress": 0, "message": str(e)}, tier)
+    logger.debug('models directory after extraction: %s', os.listdir(os.path.dirname(model_path)))
+
+def cleanup_unused_models(session_id):
     """
-    Terminate all running ASR instances before starting a new one.
+    Terminate the caller's own session (by ID) so its model reference is
+    released. Other sessions keep running. Loaded models stay in the shared
+    model cache until evicted. Returns False if there is no such session.
     """
-    print(f"[DEBUG] cleanup_unused_models called for current_lang={current_lang}")
-    terminate_all_asr_instances()
-    print(f"[DEBUG] All ASR instances terminated.")
-
-def multi_asr_listen(langs):
-    print(f"[DEBUG] multi_asr_listen called with langs={langs}")
-    results = {}
-    threads = []
-    def run_asr(lang):
-        current_model_path = LANG_MODELS.get(lang)
-        print(f"[DEBUG] run_asr thread for lang={lang}: preparing to call ASR constructor with model_path={current_model_path}")
-        # Use recognizer.ASR and pass model path
-        asr = ASR(lang, current_model_path)
-        original, translated = asr.listen()
-        print(f"[DEBUG] ASR for {lang}: original='{original}', translated='{translated}'")
-        results[lang] = (original, translated)
-    for lang in langs:
-        t = threading.Thread(target=run_asr, args=(lang,))
-        threads.append(t)
-        t.start()
-    for t in threads:
-        t.join()
-    # Always select the longest non-empty English translation (translated or original)
-    best_english = ""
-    for lang, (orig, trans) in results.items():
-        candidate = trans.strip() if trans and trans.strip() else orig.strip()
-        if len(candidate) > len(best_english):
-            best_english = candidate
-    print(f"[DEBUG] multi_asr_listen finished, best_english='{best_english}'")
-    return {"all_results": results, "best_english": best_english}
-
-def is_model_ready(lang):
+    logger.debug("cleanup_unused_models called for session_id=%s", session_id)
+    if not session_id:
+        return False
+    return terminate_session(session_id)
+
+def multi_asr_listen(langs, session=None):
     """
-    Check if the Vosk model for the given language is truly ready (key file exists).
-    For most Vosk models, 'am/final.mdl' is a reliable indicator.
-    Also check for 'model.conf' in both root and conf/ subdir.
+    Listen in several languages at once. Audio is captured and denoised once
+    and fanned out to one recognizer per language (see recognizer.MultiASR).
+    Languages that are clearly losing on word confidence are dropped after
+    the first few seconds, and best_english comes from the most confident one.
     """
-    if lang == 'en':
-        return os.path.exists(LANG_MODELS['en'])
-    model_path = LANG_MODELS.get(lang)
-    if not model_path or not os.path.isdir(model_path):
-        # Only log when model is actually missing (less noise for radio button clicks)
-        print(f"[DEBUG] is_model_ready for {lang}: model_path {model_path} not found or not a directory")
+    logger.debug("multi_asr_listen called with langs=%s", langs)
+    multi = MultiASR({lang: LANG_MODELS.get(lang) for lang in langs})
+    on_event = None
+    if session is not None:
+        # Lets /terminate and the idle reaper stop this session; results count as activity
+        attach_session(session, multi)
+        on_event = lambda event: session.touch(events=0 if event.get('keepalive') else 1)
+    result = multi.listen(on_event=on_event, keepalive_seconds=KEEPALIVE_SECONDS)
+    logger.debug("multi_asr_listen finished, best_english='%s'", result['best_english'])
+    return result
+
+def is_model_ready(lang, tier='large'):
+    """
+    Cached readiness; recomputed only after a status event for lang
+    (download, extraction, load or unload).
+    """
+    return cached_readiness(_tier_key(lang, tier), lambda _key: _check_model_files(lang, tier))
+
+def _check_model_files(lang, tier='large'):
+    """
+    A model is ready when it matches the manifest written at extraction
+    (see model_manifest.py). Models installed by hand have no manifest and
+    count as ready if their key files exist.
+    """
+    model_path = MODEL_TIERS[tier].get(lang)
+    if not model_path:
         return False
-    key_file_1 = os.path.join(model_path, 'am', 'final.mdl')
-    key_file_2 = os.path.join(model_path, 'model.conf')
-    key_file_3 = os.path.join(model_path, 'conf', 'model.conf')
-    ready = os.path.exists(key_file_1) or os.path.exists(key_file_2) or os.path.exists(key_file_3)
-    # Only log detailed info when something interesting happens or model is not ready
-    if not ready:
-        print(f"[DEBUG] is_model_ready for {lang}: key_file_1={key_file_1} ({os.path.exists(key_file_1)}), key_file_2={key_file_2} ({os.path.exists(key_file_2)}), key_file_3={key_file_3} ({os.path.exists(key_file_3)}), ready={ready}")
-    return ready
+    status, problems = verify_model(model_path)
+    if status == CORRUPT:
+        logger.debug("is_model_ready for %s: %s is corrupt: %s", lang, model_path, '; '.join(problems[:5]))
+    return status in (VERIFIED, UNVERIFIED)
+
+def verify_installed_models(repair=True):
+    """
+    Verify every installed model against its manifest in parallel (run at
+    startup). Corrupt or partial models are re-fetched in the background
+    before any session tries to load them.
+    """
+    installed = {(lang, tier): path for tier, models in MODEL_TIERS.items()
+                 for lang, path in models.items() if os.path.isdir(path)}
+    results = verify_models(list(installed.values()))
+    summary = {}
+    for (lang, tier), path in installed.items():
+        status, problems = results[path]
+        summary[_tier_key(lang, tier)] = status
+        if status == CORRUPT:
+            logger.warning("Model for '%s' (%s) is corrupt: %s", lang, tier, '; '.join(problems[:5]))
+            if repair and lang in TIER_URLS[tier]:
+                thread = threading.Thread(target=ensure_model_downloaded, args=(lang, tier), daemon=True,
+                                          name=f'repair-{_tier_key(lang, tier)}')
+                thread.start()
+                with _repair_lock:
+                    _repair_threads.append(thread)
+            elif repair:
+                logger.warning("No download URL for '%s'; reinstall %s by hand.", lang, path)
+        if tier != 'large':
+            invalidate_readiness(_tier_key(lang, tier))
+        publish_status(lang)
+    logger.info("Installed model verification: %s", summary)
+    return summary
+
+def background_downloads():
+    """Repair downloads started by verify_installed_models that are still running."""
+    with _repair_lock:
+        _repair_threads[:] = [thread for thread in _repair_threads if thread.is_alive()]
+        return list(_repair_threads)
+
+def installed_tiers(lang):
+    """tier -> model path for each tier of lang that is installed and verified."""
+    return {tier: MODEL_TIERS[tier][lang] for tier in TIERS
+            if lang in MODEL_TIERS[tier] and is_model_ready(lang, tier)}
+
+def session_models(lang, tier='auto', vocab=None):
+    """
+    The models a new session for lang may use, as tier -> model path, and
+    the tier it starts on. tier='auto' offers every installed tier and
+    starts on the one the load policy picks (see tier_policy.py); a named
+    tier pins the session to it when it is installed. A vocabulary session
+    is pinned to a tier whose model can take a grammar, preferring the
+    small one, since grammars cannot be compiled into the large graphs.
+    """
+    tiers = installed_tiers(lang) or {'large': LANG_MODELS[lang]}
+    if vocab:
+        grammar_tiers = [t for t in tiers if supports_grammar(tiers[t])]
+        if grammar_tiers:
+            tier = grammar_tiers[0]
+    if tier in tiers:
+        return {tier: tiers[tier]}, tier
+    if tier != 'auto':
+        logger.warning("No %s model installed for '%s'; using the %s tier", tier, lang, ', '.join(tiers))
+        return tiers, next(iter(tiers))
+    tier, reason = choose_tier(lang, tiers)
+    logger.debug("New %s session starts on the %s tier (%s)", lang, tier, reason)
+    return tiers, tier
+
+def _set_preload_state(lang, state):
+    _preload_state[lang] = state
+    publish_status(lang)
+
+def preload_models(langs=None):
+    """
+    Load the models for langs (default PRELOAD_LANGS) into the shared model
+    cache one after another, in list order, so the first session for them
+    does not wait for Model(). Missing models are downloaded first. Each
+    preloaded model keeps a reference, so it stays resident for the life of
+    the process. Progress is published as the 'preload' field of the model
+    status.
+    """
+    langs = PRELOAD_LANGS if langs is None else langs
+    unknown = [lang for lang in langs if lang not in LANG_MODELS]
+    if unknown:
+        logger.warning("Ignoring unknown preload languages: %s", unknown)
+    langs = [lang for lang in langs if lang in LANG_MODELS]
+    for lang in langs:
+        _set_preload_state(lang, 'queued')
+    for lang in langs:
+        if not is_model_ready(lang):
+            ensure_model_downloaded(lang)
+        if not is_model_ready(lang):
+            logger.warning("Cannot preload '%s': model is not installed.", lang)
+            _set_preload_state(lang, 'failed')
+            continue
+        _set_preload_state(lang, 'loading')
+        try:
+            acquire_model(lang, LANG_MODELS[lang])
+        except Exception as e:
+            logger.error("Preloading model for '%s' failed: %s", lang, e)
+            _set_preload_state(lang, 'failed')
+            continue
+        _set_preload_state(lang, 'loaded')
+    logger.info("Model preload finished: %s", {lang: _preload_state[lang] for lang in langs})
 
 def get_model_status_info(lang):
     """
@@ -225,21 +372,29 @@ def get_model_status_info(lang):
     Returns status dict with status, progress, and message.
     """
     if lang == 'en':
-        return {
+        info = {
             'status': 'ready',
             'progress': 100,
-            'message': 'English model is always ready.'
+            'message': 'English model is always ready.',
+            'in_memory': is_lang_loaded(lang)
         }
+        if lang in _preload_state:
+            info['preload'] = _preload_state[lang]
+        return info
     
     if is_model_ready(lang):
         # Check if this model was just loaded
         just_loaded = check_and_clear_model_loaded(lang)
-        return {
+        info = {
             'status': 'ready',
             'progress': 100,
             'message': 'Model loaded and ready.',
-            'just_loaded': just_loaded
+            'just_loaded': just_loaded,
+            'in_memory': is_lang_loaded(lang)
         }
+        if lang in _preload_state:
+            info['preload'] = _preload_state[lang]
+        return info
     
     # Get current progress if not ready
     progress_data = get_model_progress(lang)
@@ -257,8 +412,11 @@ def get_model_status_info(lang):
     else:
         message = 'Model not downloaded.'
     
-    return {
+    info = {
         'status': status,
         'progress': progress,
         'message': message
     }
+    if lang in _preload_state:
+        info['preload'] = _preload_state[lang]
+    return info
@@ -0,0 +1,424 @@
+"""
+Audio sources feeding the recognizer.
+
+Every source yields 16 kHz mono int16 PCM through read(). The local
+microphone (PyAudio) is one implementation; PushAudioSource is fed by a
+remote client over HTTP so one server can transcribe many users at once;
+FileAudioSource replays recordings for benchmarks and offline runs.
+CaptureThreadSource wraps a blocking source (the microphone by default) so
+capture runs on its own thread, into a ring buffer, no matter how long the
+consumer spends on each chunk.
+"""
+import bisect
+import logging
+import os
+import threading
+import time
+import uuid
+import wave
+import numpy as np
+from metrics import AUDIO_DROPPED_BYTES, AUDIO_OVERFLOWS, Histogram
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+
+# Microphone capture (see open_microphone); VIBERR_CAPTURE_THREAD=0 reads PyAudio on the decode loop as before
+CAPTURE_THREAD = os.environ.get('VIBERR_CAPTURE_THREAD', '1') != '0'
+CAPTURE_BUFFER_SECONDS = float(os.environ.get('VIBERR_CAPTURE_BUFFER_SECONDS', '2.0'))
+CAPTURE_POLICY = os.environ.get('VIBERR_CAPTURE_POLICY', 'drop_oldest')
+CAPTURE_FRAMES = int(os.environ.get('VIBERR_CAPTURE_FRAMES', '1024'))
+CAPTURE_POLICIES = ('drop_oldest', 'block')
+
+CAPTURE_FILL = Histogram('viberr_capture_buffer_fill_ratio',
+                         'Fill level of the capture ring buffer when the recognizer reads from it.',
+                         buckets=(0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 1.0))
+
+class AudioSource:
+    """Common interface for anything that produces 16 kHz mono int16 PCM."""
+    sample_rate = SAMPLE_RATE
+
+    def start(self):
+        pass
+
+    def read(self, n_frames):
+        """Return up to n_frames frames as bytes; b'' means the stream has ended."""
+        raise NotImplementedError
+
+    def stop(self):
+        """Ask a blocked read() to return early. Safe to call from another thread."""
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class PyAudioSource(AudioSource):
+    """Captures from the server's default input device."""
+
+    def __init__(self, frames_per_buffer=2048):
+        self.frames_per_buffer = frames_per_buffer
+        self._pa = None
+        self._stream = None
+
+    def start(self):
+        # Imported here so servers that only take client audio need no PortAudio
+        import pyaudio
+        self._pa = pyaudio.PyAudio()
+        self._stream = self._pa.open(rate=self.sample_rate, channels=1, format=pyaudio.paInt16,
+                                     input=True, output=False, frames_per_buffer=self.frames_per_buffer)
+        self._stream.start_stream()
+
+    def read(self, n_frames):
+        return self._stream.read(n_frames, exception_on_overflow=False)
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.stop_stream()
+            self._stream.close()
+            self._stream = None
+        if self._pa is not None:
+            self._pa.terminate()
+            self._pa = None
+
+class RingBuffer:
+    """
+    Preallocated ring of int16 samples. Writes and reads copy into and out
+    of one fixed array, so steady-state capture allocates nothing. Not
+    thread-safe by itself; CaptureThreadSource guards it with its lock.
+    """
+
+    def __init__(self, capacity_frames):
+        self.capacity = capacity_frames
+        self._data = np.zeros(capacity_frames, dtype=np.int16)
+        # Running totals; their difference is the fill level
+        self._written = 0
+        self._read = 0
+
+    def __len__(self):
+        return self._written - self._read
+
+    def free(self):
+        return self.capacity - len(self)
+
+    def write(self, samples):
+        """Append samples, overwriting the oldest ones if full; returns how many frames were dropped."""
+        n = len(samples)
+        dropped = 0
+        if n > self.capacity:
+            dropped = n - self.capacity
+            samples = samples[dropped:]
+            n = self.capacity
+        overflow = len(self) + n - self.capacity
+        if overflow > 0:
+            self._read += overflow
+            dropped += overflow
+        start = self._written % self.capacity
+        first = min(n, self.capacity - start)
+        self._data[start:start + first] = samples[:first]
+        self._data[:n - first] = samples[first:]
+        self._written += n
+        return dropped
+
+    def read_into(self, out):
+        """Move up to len(out) of the oldest samples into out; returns how many."""
+        n = min(len(out), len(self))
+        start = self._read % self.capacity
+        first = min(n, self.capacity - start)
+        out[:first] = self._data[start:start + first]
+        out[first:n] = self._data[:n - first]
+        self._read += n
+        return n
+
+class CaptureThreadSource(AudioSource):
+    """
+    Reads `source` on a dedicated capture thread into a preallocated ring
+    buffer of buffer_seconds, so a slow denoise/decode/translate step in the
+    consumer never stalls the device read. When the ring is full, policy
+    'drop_oldest' overwrites the oldest audio (counted as an overrun) and
+    'block' makes the capture thread wait for room. A read() that has to
+    wait for audio counts as an underrun. stats() reports the counters and
+    the fill level, for sizing chunk length against latency.
+    """
+
+    def __init__(self, source, buffer_seconds=CAPTURE_BUFFER_SECONDS, policy=CAPTURE_POLICY,
+                 capture_frames=CAPTURE_FRAMES):
+        if policy not in CAPTURE_POLICIES:
+            raise ValueError(f"Unknown capture policy {policy!r}; expected one of {CAPTURE_POLICIES}")
+        self.source = source
+        self.sample_rate = source.sample_rate
+        self.policy = policy
+        self.capture_frames = capture_frames
+        capacity = int(buffer_seconds * self.sample_rate)
+        if capacity < 2 * capture_frames:
+            # The capture thread needs room for a chunk while a reader waits for the ring to fill
+            raise ValueError(f"Capture buffer of {capacity} frames is too small; "
+                             f"needs at least {2 * capture_frames} (two capture chunks)")
+        self.ring = RingBuffer(capacity)
+        self._out = np.zeros(capture_frames, dtype=np.int16)
+        self._cond = threading.Condition()
+        self._thread = None
+        self._ended = False
+        self._stopped = False
+        self.overruns = 0
+        self.dropped_frames = 0
+        self.underruns = 0
+        self.blocked_seconds = 0.0
+        self.peak_fill = 0
+
+    def start(self):
+        self.source.start()
+        self._thread = threading.Thread(target=self._capture, daemon=True, name='audio-capture')
+        self._thread.start()
+
+    def _capture(self):
+        try:
+            while not self._stopped:
+                data = self.source.read(self.capture_frames)
+                if not data:
+                    break
+                samples = np.frombuffer(data, dtype=np.int16)
+                with self._cond:
+                    if self.policy == 'block' and self.ring.free() < len(samples):
+                        waited = time.monotonic()
+                        while self.ring.free() < len(samples) and not self._stopped:
+                            self._cond.wait(0.1)
+                        self.blocked_seconds += time.monotonic() - waited
+                    dropped = self.ring.write(samples)
+                    self.peak_fill = max(self.peak_fill, len(self.ring))
+                    self._cond.notify_all()
+                if dropped:
+                    self.overruns += 1
+                    self.dropped_frames += dropped
+                    AUDIO_OVERFLOWS.inc(source='capture')
+                    AUDIO_DROPPED_BYTES.inc(dropped * 2, source='capture')
+        except Exception as e:
+            logger.error("Audio capture failed: %s", e)
+        finally:
+            with self._cond:
+                self._ended = True
+                self._cond.notify_all()
+
+    def read(self, n_frames):
+        if len(self._out) < n_frames:
+            self._out = np.zeros(n_frames, dtype=np.int16)
+        # A read larger than the ring can ever hold (less the chunk being written, under 'block')
+        # returns what is buffered once that much is there, instead of waiting forever
+        wanted = min(n_frames, self.ring.capacity - self.capture_frames)
+        with self._cond:
+            if len(self.ring) < wanted and not self._ended:
+                self.underruns += 1
+                while len(self.ring) < wanted and not self._ended and not self._stopped:
+                    self._cond.wait()
+            if self._stopped:
+                return b''
+            CAPTURE_FILL.observe(len(self.ring) / self.ring.capacity)
+            n = self.ring.read_into(self._out[:n_frames])
+            # Room for a capture thread blocked by the 'block' policy
+            self._cond.notify_all()
+        return self._out[:n].tobytes()
+
+    def fill_level(self):
+        """(buffered frames, fraction of capacity)."""
+        with self._cond:
+            buffered = len(self.ring)
+        return buffered, buffered / self.ring.capacity
+
+    def stats(self):
+        buffered, fill = self.fill_level()
+        return {
+            'policy': self.policy,
+            'capacity_frames': self.ring.capacity,
+            'buffered_frames': buffered,
+            'fill_fraction': fill,
+            'peak_fill_fraction': self.peak_fill / self.ring.capacity,
+            'overruns': self.overruns,
+            'dropped_frames': self.dropped_frames,
+            'underruns': self.underruns,
+            'blocked_seconds': self.blocked_seconds,
+        }
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self.source.stop()
+
+    def close(self):
+        self.stop()
+        if self._thread is not None:
+            # The device read returns within one capture period
+            self._thread.join(timeout=1.0)
+            self._thread = None
+        self.source.close()
+        stats = self.stats()
+        if stats['overruns']:
+            logger.warning("Audio capture dropped %.2f s of audio in %d overrun(s); peak buffer fill %.0f%%",
+                           stats['dropped_frames'] / self.sample_rate, stats['overruns'],
+                           stats['peak_fill_fraction'] * 100)
+        else:
+            logger.debug("Capture stats: %s", stats)
+
+def open_microphone():
+    """The server microphone, captured on its own thread unless VIBERR_CAPTURE_THREAD=0."""
+    microphone = PyAudioSource(frames_per_buffer=CAPTURE_FRAMES)
+    if not CAPTURE_THREAD:
+        return microphone
+    return CaptureThreadSource(microphone)
+
+class PushAudioSource(AudioSource):
+    """
+    Buffers PCM pushed by a client. If the client pushes faster than the
+    recognizer consumes, the oldest audio beyond max_buffered_seconds is
+    dropped and counted. A read() that sees no audio for idle_timeout
+    seconds treats the client as gone and ends the stream.
+    """
+
+    def __init__(self, max_buffered_seconds=10.0, idle_timeout=30.0):
+        self.max_buffered_bytes = int(max_buffered_seconds * self.sample_rate) * 2
+        self.idle_timeout = idle_timeout
+        self.received_bytes = 0
+        self.dropped_bytes = 0
+        self._buffer = bytearray()
+        self._cond = threading.Condition()
+        self._ended = False
+        self._stopped = False
+
+    def push(self, data):
+        """Append client audio. Returns False once the stream has ended."""
+        with self._cond:
+            if self._ended or self._stopped:
+                return False
+            self._buffer.extend(data)
+            self.received_bytes += len(data)
+            excess = len(self._buffer) - self.max_buffered_bytes
+            if excess > 0:
+                excess += excess % 2  # keep sample alignment
+                del self._buffer[:excess]
+                self.dropped_bytes += excess
+                AUDIO_OVERFLOWS.inc(source='push')
+                AUDIO_DROPPED_BYTES.inc(excess, source='push')
+            self._cond.notify_all()
+            return True
+
+    def end(self):
+        """Mark the end of client audio; buffered audio is still delivered."""
+        with self._cond:
+            self._ended = True
+            self._cond.notify_all()
+
+    def read(self, n_frames):
+        wanted = n_frames * 2
+        deadline = time.monotonic() + self.idle_timeout
+        with self._cond:
+            while len(self._buffer) < wanted and not self._ended and not self._stopped:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logger.info("PushAudioSource idle timeout, ending stream")
+                    self._ended = True
+                    break
+                self._cond.wait(remaining)
+            if self._stopped:
+                return b''
+            take = min(wanted, len(self._buffer))
+            take -= take % 2
+            data = bytes(self._buffer[:take])
+            del self._buffer[:take]
+            return data
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def close(self):
+        self.stop()
+
+class FileAudioSource(AudioSource):
+    """
+    Replays a WAV file (16 kHz mono 16-bit) or headerless raw PCM in the same
+    format. With realtime=True reads are paced to the audio clock, otherwise
+    audio is delivered as fast as it is consumed.
+    """
+
+    def __init__(self, path, realtime=False):
+        self.path = path
+        self.realtime = realtime
+        self.frames_read = 0
+        self._file = None
+        self._wav = None
+        self._started_at = None
+        # (frame position after a read, wall time the read returned), for latency lookups
+        self._read_marks = []
+
+    def start(self):
+        if self.path.lower().endswith('.wav'):
+            self._wav = wave.open(self.path, 'rb')
+            if (self._wav.getframerate() != self.sample_rate or self._wav.getnchannels() != 1
+                    or self._wav.getsampwidth() != 2):
+                self._wav.close()
+                raise ValueError(f"{self.path}: expected {self.sample_rate} Hz mono 16-bit PCM")
+        else:
+            self._file = open(self.path, 'rb')
+        self._started_at = time.perf_counter()
+
+    def read(self, n_frames):
+        if self.realtime:
+            due = self._started_at + (self.frames_read + n_frames) / self.sample_rate
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        if self._wav is not None:
+            data = self._wav.readframes(n_frames)
+        else:
+            data = self._file.read(n_frames * 2)
+        self.frames_read += len(data) // 2
+        self._read_marks.append((self.frames_read, time.perf_counter()))
+        return data
+
+    def duration_seconds(self):
+        return self.frames_read / self.sample_rate
+
+    def wall_time_at(self, audio_seconds):
+        """perf_counter() time at which the sample at audio_seconds was delivered."""
+        frame = int(audio_seconds * self.sample_rate)
+        i = bisect.bisect_left(self._read_marks, (frame, 0.0))
+        if i >= len(self._read_marks):
+            i = len(self._read_marks) - 1
+        return self._read_marks[i][1]
+
+    def close(self):
+        if self._wav is not None:
+            self._wav.close()
+            self._wav = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+# Registry of client-fed sources, keyed by the session id handed to the client
+_push_sources = {}
+_push_sources_lock = threading.Lock()
+
+def create_push_source(session_id=None, **kwargs):
+    """Create and register a PushAudioSource; returns (session_id, source)."""
+    session_id = session_id or uuid.uuid4().hex
+    source = PushAudioSource(**kwargs)
+    with _push_sources_lock:
+        _push_sources[session_id] = source
+    return session_id, source
+
+def get_push_source(session_id):
+    with _push_sources_lock:
+        return _push_sources.get(session_id)
+
+def unregister_push_source(session_id):
+    with _push_sources_lock:
+        source = _push_sources.pop(session_id, None)
+    if source is not None:
+        source.close()
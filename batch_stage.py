@@ -0,0 +1,107 @@
+"""
+Background micro-batching shared by the translation and NLP stages.
+
+A MicroBatchStage owns a bounded queue and one or more worker threads.
+Callers submit (lang, text) and get a Future back straight away; a full
+queue never stalls them, the Future just gets its fallback result. Each
+worker takes up to batch_size queued items, waiting up to max_delay_ms
+for more after the first (0 takes only what is already queued), groups
+them by language and hands each group to the subclass's _process_group.
+"""
+import functools
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+class MicroBatchStage:
+    """Bounded queue drained by worker threads in per-language micro-batches."""
+
+    # Prefix of the worker thread names, and what the stage is called in log messages
+    name = 'stage'
+    label = 'Stage'
+    # Counters every stage keeps; subclasses pass their own on top
+    STATS = ('requests', 'batches', 'rejected', 'errors', 'total_s')
+
+    def __init__(self, workers=1, max_queue=256, batch_size=16, max_delay_ms=0, stats=()):
+        self.batch_size = batch_size
+        self.max_delay = max_delay_ms / 1000.0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self.stats = {key: 0.0 if key.endswith('_s') else 0 for key in self.STATS + tuple(stats)}
+        self._stats_lock = threading.Lock()
+        self._workers = [threading.Thread(target=self._run, daemon=True, name=f"{self.name}-{i}")
+                         for i in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    def _resolved(self, result):
+        future = Future()
+        future.set_result(result)
+        return future
+
+    def _enqueue(self, lang, text, fallback):
+        """Queue text; returns its Future, resolved to fallback if the queue is full."""
+        future = Future()
+        try:
+            self._queue.put_nowait((lang, text, future, time.perf_counter()))
+        except queue.Full:
+            logger.warning("%s queue full, passing text through (lang=%s)", self.label, lang)
+            self._count('rejected')
+            future.set_result(fallback)
+        return future
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_delay
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            by_lang = {}
+            for lang, text, future, submitted in self._next_batch():
+                by_lang.setdefault(lang, []).append((text, future, submitted))
+            for lang, items in by_lang.items():
+                start = time.perf_counter()
+                self._process_group(lang, items)
+                self._count('total_s', time.perf_counter() - start)
+                self._count('batches')
+
+    def _process_group(self, lang, items):
+        """Handle one language's (text, future, submitted) items; must resolve every future."""
+        raise NotImplementedError
+
+    def _finish(self, items, results, histogram, **labels):
+        """Resolve each item's future with its result and record its queue-to-result latency."""
+        done = time.perf_counter()
+        for (_text, future, submitted), result in zip(items, results):
+            future.set_result(result)
+            histogram.observe(done - submitted, **labels)
+
+def shared_stage(factory):
+    """Make factory return one process-wide stage, created on the first call."""
+    lock = threading.Lock()
+    stages = []
+
+    @functools.wraps(factory)
+    def get_stage():
+        with lock:
+            if not stages:
+                stages.append(factory())
+            return stages[0]
+    return get_stage
@@ -0,0 +1,173 @@
+"""
+Offline batch transcription of recorded audio.
+
+Starts a pool of worker processes that each load the Vosk model once, then
+streams files through them in parallel. Results are appended to a JSONL file
+as they finish (one line per file: transcript, translation, timings), so an
+interrupted run can be resumed: files already in the output are skipped.
+With --nlp each segment also gets sentences, entities and cased text; a
+file's segments go through spaCy together, --nlp-batch-size at a time.
+
+Usage:
+    python batch_transcribe.py INPUT --output results.jsonl [--lang en]
+                               [--workers N] [--model-path PATH] [--denoise off]
+                               [--nlp] [--nlp-batch-size 256]
+
+INPUT is a directory (searched recursively for .wav/.raw/.pcm files) or a
+manifest: a text file with one path per line, or JSONL with a "path" key.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from asr import LANG_MODELS
+from audio_source import FileAudioSource
+from denoise import DENOISE_MODES
+from model_cache import acquire_model
+from nlp_utils import load_pipeline, process_texts
+from recognizer import ASR
+from translate_util import TRANSLATION_BACKENDS, TranslationStage
+
+AUDIO_EXTENSIONS = ('.wav', '.raw', '.pcm')
+
+def find_audio_files(input_path):
+    """Expand a directory or manifest into a sorted list of audio file paths."""
+    if os.path.isdir(input_path):
+        found = []
+        for root, _dirs, files in os.walk(input_path):
+            for name in files:
+                if name.lower().endswith(AUDIO_EXTENSIONS):
+                    found.append(os.path.join(root, name))
+        return sorted(found)
+    base = os.path.dirname(os.path.abspath(input_path))
+    paths = []
+    with open(input_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            path = json.loads(line)['path'] if line.startswith('{') else line
+            paths.append(path if os.path.isabs(path) else os.path.join(base, path))
+    return paths
+
+def load_completed(output_path):
+    """Files that already have a successful result in the output JSONL."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue  # Partially written line from a crash
+            if 'error' not in row:
+                done.add(row['file'])
+    return done
+
+# Per-process worker state, set up once by _init_worker
+_worker = {}
+
+def _init_worker(lang, model_path, denoise, translator, nlp_batch_size=None):
+    # Hold a reference so the model stays loaded for the life of the worker
+    acquire_model(lang, model_path)
+    if nlp_batch_size:
+        load_pipeline(lang)
+    _worker.update(
+        lang=lang,
+        model_path=model_path,
+        denoise=denoise,
+        translator=TranslationStage(backend=TRANSLATION_BACKENDS[translator](), workers=1),
+        nlp_batch_size=nlp_batch_size,
+    )
+
+def transcribe_file(path):
+    """Transcribe one file in a worker; returns a JSON-serialisable result row."""
+    start = time.perf_counter()
+    try:
+        asr = ASR(_worker['lang'], _worker['model_path'], denoise=_worker['denoise'],
+                  translator=_worker['translator'], words=True)
+        source = FileAudioSource(path)
+        segments = {}
+        for event in asr.recognize_stream(source):
+            if 'transcription' in event:
+                segments[event['utterance_id']] = {
+                    'text': event['transcription'],
+                    'translation': event.get('translation'),
+                    'words': event.get('words', []),
+                }
+            elif 'translation' in event:
+                segments[event['utterance_id']]['translation'] = event['translation']
+        ordered = [segments[key] for key in sorted(segments)]
+        nlp_seconds = None
+        if _worker['nlp_batch_size']:
+            nlp_start = time.perf_counter()
+            results = process_texts([seg['text'] for seg in ordered], _worker['lang'],
+                                    batch_size=_worker['nlp_batch_size'])
+            for seg, result in zip(ordered, results):
+                seg['nlp'] = result
+            nlp_seconds = time.perf_counter() - nlp_start
+        return {
+            'file': path,
+            'duration_s': source.duration_seconds(),
+            'transcript': ' '.join(seg['text'] for seg in ordered),
+            'translation': ' '.join(seg['translation'] or '' for seg in ordered).strip(),
+            'segments': ordered,
+            'timings': {
+                'wall_s': time.perf_counter() - start,
+                'stages': asr.timer.summary(),
+                'nlp_s': nlp_seconds,
+            },
+            'vad': asr.vad.stats(),
+        }
+    except Exception as e:
+        return {'file': path, 'error': str(e), 'timings': {'wall_s': time.perf_counter() - start}}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', help='Directory of audio files or a manifest file')
+    parser.add_argument('--output', required=True, help='JSONL results file (appended to; enables resume)')
+    parser.add_argument('--lang', default='en', choices=sorted(LANG_MODELS))
+    parser.add_argument('--model-path', help='Override the model directory for --lang')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--denoise', choices=DENOISE_MODES, default='off')
+    parser.add_argument('--translator', choices=sorted(TRANSLATION_BACKENDS), default='google')
+    parser.add_argument('--nlp', action='store_true', help='Add sentences, entities and cased text per segment')
+    parser.add_argument('--nlp-batch-size', type=int, default=256, help='Segments per spaCy batch with --nlp')
+    args = parser.parse_args(argv)
+
+    model_path = args.model_path or LANG_MODELS[args.lang]
+    files = find_audio_files(args.input)
+    completed = load_completed(args.output)
+    todo = [path for path in files if path not in completed]
+    print(f"{len(files)} files, {len(files) - len(todo)} already done, {len(todo)} to transcribe "
+          f"with {args.workers} workers", file=sys.stderr)
+    if not todo:
+        return
+
+    audio_seconds = 0.0
+    failures = 0
+    start = time.perf_counter()
+    with open(args.output, 'a', encoding='utf-8') as out, multiprocessing.Pool(
+            processes=args.workers, initializer=_init_worker,
+            initargs=(args.lang, model_path, args.denoise, args.translator,
+                      args.nlp_batch_size if args.nlp else None)) as pool:
+        for i, row in enumerate(pool.imap_unordered(transcribe_file, todo), 1):
+            out.write(json.dumps(row, ensure_ascii=False) + '\n')
+            out.flush()
+            if 'error' in row:
+                failures += 1
+                print(f"[{i}/{len(todo)}] {row['file']}: ERROR {row['error']}", file=sys.stderr)
+            else:
+                audio_seconds += row['duration_s']
+                print(f"[{i}/{len(todo)}] {row['file']}", file=sys.stderr)
+    wall = time.perf_counter() - start
+    # Audio-hours per wall-clock hour is the same ratio as audio seconds per wall second
+    speedup = audio_seconds / wall if wall else 0.0
+    print(f"Transcribed {audio_seconds / 3600:.2f} audio hours in {wall / 3600:.3f} h "
+          f"({speedup:.1f} audio-hours per wall-clock hour), {failures} failures", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""
+End-to-end latency/throughput benchmark for the recognition pipeline.
+
+Replays recorded audio through recognizer.ASR with a FileAudioSource and
+writes a JSON report (real-time factor, per-stage timings and
+end-of-utterance-to-result latency) so runs can be compared across commits,
+models and chunk sizes.
+
+Usage:
+    python benchmark.py --audio samples/a.wav [--audio ...] [--lang en]
+                        [--model-path PATH | --tier small|large] [--chunk-size 2048]
+                        [--denoise streaming] [--vad on|off] [--vocab sample_words]
+                        [--translator local] [--realtime]
+                        [--output bench.json]
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+from asr import LANG_MODELS, MODEL_TIERS
+from audio_source import FileAudioSource
+from denoise import DENOISE_MODES
+from recognizer import ASR
+from translate_util import TRANSLATION_BACKENDS, TranslationStage
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+def run_file(path, lang, model_path, chunk_size, denoise, realtime, translator, vad=None, vocab=None):
+    """Replay one file; returns (audio_seconds, wall_seconds, stage timer, utterances, vad stats)."""
+    # Word timings let us find where each utterance ended in the audio
+    asr = ASR(lang, model_path, denoise=denoise, chunk_size=chunk_size, translator=translator, words=True,
+              vad=vad, vocab=vocab)
+    source = FileAudioSource(path, realtime=realtime)
+    utterances = []
+    start = time.perf_counter()
+    for result in asr.recognize_stream(source):
+        if 'transcription' not in result:
+            # Ready message or a translation following its transcription
+            continue
+        emitted = time.perf_counter()
+        words = (asr.last_result or {}).get('result') or []
+        if words:
+            utterance_end = words[-1]['end']
+        else:
+            utterance_end = source.duration_seconds()
+        latency = emitted - source.wall_time_at(utterance_end)
+        utterances.append({
+            'text': result.get('transcription', ''),
+            'audio_end_s': utterance_end,
+            'latency_ms': 1000.0 * max(0.0, latency),
+        })
+    wall = time.perf_counter() - start
+    return source.duration_seconds(), wall, asr.timer, utterances, asr.vad.stats()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--audio', action='append', required=True, help='WAV or raw 16 kHz mono int16 file')
+    parser.add_argument('--lang', default='en', choices=sorted(LANG_MODELS))
+    parser.add_argument('--model-path', help='Override the model directory for --lang')
+    parser.add_argument('--tier', choices=sorted(MODEL_TIERS), default='large', help='Model size for --lang')
+    parser.add_argument('--chunk-size', type=int, default=2048, help='Frames per read')
+    parser.add_argument('--denoise', choices=DENOISE_MODES, default=None)
+    parser.add_argument('--vad', choices=('on', 'off'), default=None,
+                        help='Voice-activity gating (default: VIBERR_VAD, on)')
+    parser.add_argument('--vocab', help='Decode against the grammar of data/<vocab>.json')
+    parser.add_argument('--translator', choices=sorted(TRANSLATION_BACKENDS), default='local',
+                        help="Translation backend; 'local' keeps runs offline and repeatable")
+    parser.add_argument('--realtime', action='store_true', help='Pace replay to the audio clock')
+    parser.add_argument('--output', help='Write the JSON report here (default: stdout)')
+    args = parser.parse_args(argv)
+
+    model_path = args.model_path or MODEL_TIERS[args.tier][args.lang]
+    translator = TranslationStage(backend=TRANSLATION_BACKENDS[args.translator]())
+    audio_seconds = wall_seconds = 0.0
+    stages = {}
+    utterances = []
+    vad = None if args.vad is None else args.vad == 'on'
+    vad_frames = {'frames_processed': 0, 'frames_skipped': 0}
+    for path in args.audio:
+        print(f"Replaying {path}...", file=sys.stderr)
+        seconds, wall, timer, file_utterances, vad_stats = run_file(
+            path, args.lang, model_path, args.chunk_size, args.denoise, args.realtime, translator, vad, args.vocab)
+        for key in vad_frames:
+            vad_frames[key] += vad_stats[key]
+        audio_seconds += seconds
+        wall_seconds += wall
+        for name, total in timer.totals.items():
+            entry = stages.setdefault(name, {'total_s': 0.0, 'count': 0})
+            entry['total_s'] += total
+            entry['count'] += timer.counts[name]
+        for utterance in file_utterances:
+            utterance['file'] = path
+        utterances.extend(file_utterances)
+
+    for entry in stages.values():
+        entry['mean_ms'] = 1000.0 * entry['total_s'] / entry['count'] if entry['count'] else 0.0
+        entry['per_audio_second'] = entry['total_s'] / audio_seconds if audio_seconds else 0.0
+    latencies = [u['latency_ms'] for u in utterances]
+    report = {
+        'commit': _git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'settings': {
+            'lang': args.lang,
+            'model_path': model_path,
+            'chunk_size': args.chunk_size,
+            'denoise': args.denoise,
+            'vad': args.vad,
+            'vocab': args.vocab,
+            'tier': None if args.model_path else args.tier,
+            'translator': args.translator,
+            'realtime': args.realtime,
+        },
+        'audio_seconds': audio_seconds,
+        'wall_seconds': wall_seconds,
+        'real_time_factor': wall_seconds / audio_seconds if audio_seconds else None,
+        'stages': stages,
+        # Frames the VAD kept away from denoise and decode
+        'vad': dict(vad_frames, skipped_fraction=(
+            vad_frames['frames_skipped'] / max(1, vad_frames['frames_processed'] + vad_frames['frames_skipped']))),
+        # Background translation workers, off the recognition loop
+        'translation': dict(translator.stats),
+        'latency_ms': {
+            'mean': sum(latencies) / len(latencies) if latencies else None,
+            'p50': _percentile(latencies, 50),
+            'p95': _percentile(latencies, 95),
+            'max': max(latencies) if latencies else None,
+        },
+        'utterances': utterances,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+        print(f"Wrote {args.output}: RTF={report['real_time_factor']}", file=sys.stderr)
+    else:
+        print(text)
+    return report
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""
+Pluggable noise suppression stages for the recognition loop.
+
+- 'off'       passes audio through untouched.
+- 'legacy'    runs noisereduce.reduce_noise on every chunk (previous behaviour).
+- 'streaming' keeps a persistent noise profile and does overlap-add spectral
+              gating across chunk boundaries, so no per-chunk re-estimation
+              and no edge artifacts.
+
+All stages take and return int16 sample arrays and record how much CPU time
+they spent per second of audio so modes can be compared.
+"""
+import os
+import time
+import numpy as np
+
+DENOISE_MODES = ('off', 'legacy', 'streaming')
+DEFAULT_DENOISE_MODE = os.environ.get('VIBERR_DENOISE', 'streaming')
+
+class Denoiser:
+    mode = None
+
+    def __init__(self, sr=16000):
+        self.sr = sr
+        self.samples_processed = 0
+        self.cpu_seconds = 0.0
+
+    def process(self, chunk):
+        """Denoise one int16 chunk. The result may be reused by the next call."""
+        start = time.thread_time()
+        out = self._process(chunk)
+        self.cpu_seconds += time.thread_time() - start
+        self.samples_processed += len(chunk)
+        return out
+
+    def _process(self, chunk):
+        raise NotImplementedError
+
+    def cpu_per_audio_second(self):
+        if not self.samples_processed:
+            return 0.0
+        return self.cpu_seconds / (self.samples_processed / self.sr)
+
+class NoDenoiser(Denoiser):
+    mode = 'off'
+
+    def _process(self, chunk):
+        return chunk
+
+class LegacyDenoiser(Denoiser):
+    mode = 'legacy'
+
+    def _process(self, chunk):
+        # Imported on first use: noisereduce takes about a second to import
+        import noisereduce as nr
+        return nr.reduce_noise(y=chunk, sr=self.sr, stationary=True, prop_decrease=1.0)
+
+class StreamingDenoiser(Denoiser):
+    """
+    Stationary spectral gate that runs incrementally over a stream.
+
+    Frames of n_fft samples with 50% overlap are windowed with a square-root
+    Hann window on analysis and synthesis, so overlap-add reconstructs the
+    signal exactly where the gain is 1. The noise profile is a per-bin
+    magnitude floor that follows quiet passages quickly and speech slowly.
+    Output lags input by two hops (32 ms at the defaults).
+    """
+    mode = 'streaming'
+
+    def __init__(self, sr=16000, n_fft=512, over_subtraction=1.5, gain_floor=0.1,
+                 noise_attack=0.3, noise_release=0.02):
+        super().__init__(sr)
+        self.n_fft = n_fft
+        self.hop = n_fft // 2
+        self.over_subtraction = over_subtraction
+        self.gain_floor = gain_floor
+        self.noise_attack = noise_attack
+        self.noise_release = noise_release
+        # Periodic Hann, so the squared window sums to 1 at 50% overlap
+        self.window = np.sqrt(np.hanning(n_fft + 1)[:-1]).astype(np.float32)
+        self.noise_profile = None
+        self._pending = 0                          # input samples not yet part of a frame
+        self._signal = np.zeros(0, np.float32)     # last hop of consumed input + pending + new chunk
+        self._tail = np.zeros(self.hop, np.float32)  # second half of the last synthesized frame
+        # Output FIFO, primed with one hop of silence so every call can return a full chunk
+        self._out = np.zeros(0, np.float32)
+        self._n_out = self.hop
+        self._result = np.zeros(0, np.int16)
+
+    def _reserve(self, chunk_len):
+        size = 2 * self.hop + chunk_len
+        if len(self._signal) < size:
+            signal = np.zeros(size, np.float32)
+            signal[:len(self._signal)] = self._signal
+            self._signal = signal
+            out = np.zeros(size + self.hop, np.float32)
+            out[:len(self._out)] = self._out
+            self._out = out
+            self._result = np.zeros(chunk_len, np.int16)
+        elif len(self._result) < chunk_len:
+            self._result = np.zeros(chunk_len, np.int16)
+
+    def _update_noise(self, mag):
+        level = mag.mean(axis=0)
+        if self.noise_profile is None:
+            self.noise_profile = level
+            return
+        rate = np.where(level < self.noise_profile, self.noise_attack, self.noise_release)
+        self.noise_profile += rate * (level - self.noise_profile)
+
+    def _process(self, chunk):
+        n = len(chunk)
+        hop = self.hop
+        self._reserve(n)
+        signal = self._signal
+        start = hop + self._pending
+        signal[start:start + n] = chunk
+        available = self._pending + n
+        n_hops = available // hop
+
+        if n_hops:
+            used = hop + n_hops * hop
+            frames = np.lib.stride_tricks.sliding_window_view(signal[:used], self.n_fft)[::hop]
+            spec = np.fft.rfft(frames * self.window, axis=1)
+            mag = np.abs(spec)
+            self._update_noise(mag)
+            gain = 1.0 - self.over_subtraction * self.noise_profile / (mag + 1e-9)
+            np.maximum(gain, self.gain_floor, out=gain)
+            spec *= gain
+            synth = np.fft.irfft(spec, n=self.n_fft, axis=1).astype(np.float32)
+            synth *= self.window
+            # Overlap-add: first half of each frame plus second half of the previous one
+            ola = synth[:, :hop]
+            ola[0] += self._tail
+            ola[1:] += synth[:-1, hop:]
+            self._tail[:] = synth[-1, hop:]
+            self._out[self._n_out:self._n_out + n_hops * hop] = ola.ravel()
+            self._n_out += n_hops * hop
+            # Keep the last consumed hop as history for the next frame, plus leftovers
+            keep = hop + available - n_hops * hop
+            signal[:keep] = signal[used - hop:used - hop + keep]
+        self._pending = available - n_hops * hop
+
+        # The primed hop guarantees at least n samples are ready here
+        result = self._result[:n]
+        np.clip(self._out[:n], -32768, 32767, out=self._out[:n])
+        result[:] = self._out[:n]
+        self._n_out -= n
+        self._out[:self._n_out] = self._out[n:n + self._n_out]
+        return result
+
+_DENOISERS = {
+    'off': NoDenoiser,
+    'legacy': LegacyDenoiser,
+    'streaming': StreamingDenoiser,
+}
+
+def make_denoiser(mode=None, sr=16000):
+    """Create a fresh, per-session denoiser for the given mode."""
+    mode = mode or DEFAULT_DENOISE_MODE
+    if mode not in _DENOISERS:
+        raise ValueError(f"Unknown denoise mode '{mode}', expected one of {', '.join(DENOISE_MODES)}")
+    return _DENOISERS[mode](sr=sr)
@@ -1,15 +1,19 @@
 import sys
-from asr import ensure_model_downloaded, LANG_MODELS
+from asr import ensure_model_downloaded, LANG_MODELS, MODEL_TIERS
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print("Usage: python download_model.py <lang_code>")
+        print("Usage: python download_model.py <lang_code> [small|large]")
         print("Available languages:", ', '.join(LANG_MODELS.keys()))
         sys.exit(1)
     lang = sys.argv[1]
-    if lang not in LANG_MODELS:
+    tier = sys.argv[2] if len(sys.argv) > 2 else 'large'
+    if tier not in MODEL_TIERS:
+        print(f"Unknown model tier '{tier}'; expected one of: {', '.join(MODEL_TIERS)}")
+        sys.exit(1)
+    if lang not in MODEL_TIERS[tier]:
         print(f"Language '{lang}' is not supported.")
-        print("Available languages:", ', '.join(LANG_MODELS.keys()))
+        print("Available languages:", ', '.join(MODEL_TIERS[tier].keys()))
         sys.exit(1)
-    ensure_model_downloaded(lang)
-    print(f"Model for '{lang}' is ready.")
+    ensure_model_downloaded(lang, tier)
+    print(f"Model for '{lang}' ({tier}) is ready.")
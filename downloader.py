@@ -0,0 +1,328 @@
+"""
+Parallel, resumable model archive downloads with streaming extraction.
+
+The archive is fetched as fixed-size segments with HTTP Range requests on a
+small thread pool. Finished segments are recorded in a sidecar state file,
+so a restarted download only fetches what is missing. The tail segment (which
+holds the zip central directory) is fetched first; from then on every zip
+entry is extracted as soon as all of its bytes are on disk, instead of in a
+second pass. A corrupt entry only re-fetches the segments it spans.
+
+Servers without Range support fall back to a single sequential stream.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from model_manifest import write_manifest
+from metrics import DOWNLOAD_BYTES, DOWNLOAD_SECONDS, DOWNLOAD_THROUGHPUT
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SIZE = 8 * 1024 * 1024
+READ_CHUNK = 256 * 1024
+
+class DownloadError(Exception):
+    pass
+
+class _Progress:
+    """Thread-safe byte counter that reports percentages to a callback."""
+
+    def __init__(self, total, callback):
+        self.total = total
+        self.done = 0
+        self.callback = callback
+        self._lock = threading.Lock()
+        self._last_percent = -1
+
+    def add(self, n):
+        with self._lock:
+            self.done += n
+            percent = int(self.done * 100 / self.total) if self.total else 0
+            if percent == self._last_percent:
+                return
+            self._last_percent = percent
+        if self.callback:
+            self.callback('downloading', percent, self.done, self.total)
+
+def _probe(url):
+    """Return (size, etag, supports_ranges) for url."""
+    # requests is imported on first download, not at startup
+    import requests
+    r = requests.head(url, allow_redirects=True, timeout=30)
+    r.raise_for_status()
+    size = int(r.headers.get('content-length', 0))
+    ranges = r.headers.get('accept-ranges', '').lower() == 'bytes'
+    return size, r.headers.get('etag'), ranges and size > 0
+
+def _load_state(state_path, url, size, etag, segment_size):
+    try:
+        with open(state_path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        if (state.get('url'), state.get('size'), state.get('etag'), state.get('segment_size')) == (url, size, etag, segment_size):
+            return set(state.get('done', []))
+    except (OSError, ValueError):
+        pass
+    return set()
+
+def _save_state(state_path, url, size, etag, segment_size, done):
+    tmp_path = f"{state_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'url': url, 'size': size, 'etag': etag, 'segment_size': segment_size,
+                   'done': sorted(done)}, f)
+    os.replace(tmp_path, state_path)
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+class SegmentedDownload:
+    """One archive download; see module docstring."""
+
+    def __init__(self, url, zip_path, extract_dir, progress=None, workers=4,
+                 segment_size=SEGMENT_SIZE, expected_sha256=None, max_repairs=3):
+        self.url = url
+        self.zip_path = zip_path
+        self.part_path = f"{zip_path}.part"
+        self.state_path = f"{zip_path}.state"
+        self.extract_dir = extract_dir
+        self.progress_callback = progress
+        self.workers = workers
+        self.segment_size = segment_size
+        self.expected_sha256 = expected_sha256
+        self.max_repairs = max_repairs
+        self._done = set()
+        self._cond = threading.Condition()
+        self._failed = None
+        # Bytes actually transferred by this run (resumed segments excluded)
+        self.fetched_bytes = 0
+        self._fetched_lock = threading.Lock()
+
+    # -- segment bookkeeping -------------------------------------------------
+
+    def _segment_range(self, index):
+        start = index * self.segment_size
+        return start, min(self.size, start + self.segment_size) - 1
+
+    def _segments_for(self, start, end):
+        """Indices of the segments covering bytes [start, end)."""
+        if end <= start:
+            return range(0)
+        return range(start // self.segment_size, (end - 1) // self.segment_size + 1)
+
+    def _count_fetched(self, n):
+        with self._fetched_lock:
+            self.fetched_bytes += n
+        DOWNLOAD_BYTES.inc(n)
+
+    def _mark_done(self, index):
+        with self._cond:
+            self._done.add(index)
+            _save_state(self.state_path, self.url, self.size, self.etag, self.segment_size, self._done)
+            self._cond.notify_all()
+
+    def _fetch_segment(self, index):
+        import requests
+        start, end = self._segment_range(index)
+        try:
+            r = requests.get(self.url, headers={'Range': f'bytes={start}-{end}'}, stream=True, timeout=60)
+            r.raise_for_status()
+            if r.status_code != 206:
+                raise DownloadError(f"Server ignored range request for segment {index}")
+            written = 0
+            with open(self.part_path, 'r+b') as f:
+                f.seek(start)
+                for chunk in r.iter_content(chunk_size=READ_CHUNK):
+                    if chunk:
+                        f.write(chunk)
+                        written += len(chunk)
+                        self._progress.add(len(chunk))
+                        self._count_fetched(len(chunk))
+            if written != end - start + 1:
+                self._progress.add(-written)
+                raise DownloadError(f"Segment {index} truncated ({written} of {end - start + 1} bytes)")
+            self._mark_done(index)
+        except Exception as e:
+            with self._cond:
+                self._failed = e
+                self._cond.notify_all()
+            raise
+
+    def _wait_for(self, indices):
+        with self._cond:
+            while not all(i in self._done for i in indices):
+                if self._failed is not None:
+                    raise DownloadError(f"Download failed: {self._failed}") from self._failed
+                self._cond.wait()
+
+    # -- extraction ------------------------------------------------------------
+
+    def _open_archive(self):
+        """Open the zip once its central directory is on disk."""
+        tail = self._segments_for(max(0, self.size - 1), self.size)
+        self._wait_for(tail)
+        while True:
+            with self._cond:
+                done_before = len(self._done)
+            try:
+                return zipfile.ZipFile(self.part_path)
+            except zipfile.BadZipFile:
+                # Central directory reaches into segments that are still downloading
+                with self._cond:
+                    if len(self._done) != done_before:
+                        continue
+                    if len(self._done) == self.n_segments:
+                        raise
+                    if self._failed is not None:
+                        raise DownloadError(f"Download failed: {self._failed}") from self._failed
+                    self._cond.wait()
+
+    def _extract_streaming(self, staging_dir):
+        """Extract each entry as soon as its bytes are complete. Returns corrupt segments."""
+        corrupt = set()
+        with self._open_archive() as archive:
+            infos = sorted(archive.infolist(), key=lambda info: info.header_offset)
+            cd_start = min(self.size, archive.start_dir)
+            for i, info in enumerate(infos):
+                end = infos[i + 1].header_offset if i + 1 < len(infos) else cd_start
+                needed = self._segments_for(info.header_offset, end)
+                self._wait_for(needed)
+                try:
+                    archive.extract(info, staging_dir)
+                except (zipfile.BadZipFile, OSError, EOFError) as e:
+                    logger.warning("Corrupt zip entry %s: %s. Re-fetching %d segment(s).", info.filename, e, len(needed))
+                    corrupt.update(needed)
+                if self.progress_callback and len(self._done) == self.n_segments:
+                    self.progress_callback('extracting', int((i + 1) * 100 / len(infos)), i + 1, len(infos))
+        return corrupt
+
+    # -- driver ------------------------------------------------------------------
+
+    def _download_parallel(self):
+        self.n_segments = (self.size + self.segment_size - 1) // self.segment_size
+        self._done = {i for i in _load_state(self.state_path, self.url, self.size, self.etag, self.segment_size)
+                      if i < self.n_segments}
+        if not os.path.exists(self.part_path) or os.path.getsize(self.part_path) != self.size:
+            self._done = set()
+            with open(self.part_path, 'wb') as f:
+                f.truncate(self.size)
+        already = sum(self._segment_range(i)[1] - self._segment_range(i)[0] + 1 for i in self._done)
+        self._progress = _Progress(self.size, self.progress_callback)
+        self._progress.add(already)
+
+        staging_dir = f"{self.extract_dir}/.extracting-{os.path.basename(self.zip_path)}"
+        for attempt in range(self.max_repairs + 1):
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            os.makedirs(staging_dir)
+            self._failed = None
+            missing = [i for i in range(self.n_segments) if i not in self._done]
+            # Tail first: it holds the central directory that extraction needs
+            missing.sort(key=lambda i: i != self.n_segments - 1)
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                futures = [pool.submit(self._fetch_segment, i) for i in missing]
+                try:
+                    corrupt = self._extract_streaming(staging_dir)
+                finally:
+                    for future in futures:
+                        future.cancel()
+                for future in futures:
+                    if not future.cancelled():
+                        future.result()
+            if not corrupt:
+                return staging_dir
+            with self._cond:
+                self._done -= corrupt
+                _save_state(self.state_path, self.url, self.size, self.etag, self.segment_size, self._done)
+            for i in corrupt:
+                start, end = self._segment_range(i)
+                self._progress.add(-(end - start + 1))
+        raise DownloadError(f"Archive still corrupt after {self.max_repairs} repair attempts")
+
+    def _download_sequential(self):
+        import requests
+        with requests.get(self.url, stream=True, timeout=60) as r:
+            r.raise_for_status()
+            total = int(r.headers.get('content-length', 0))
+            self._progress = _Progress(total, self.progress_callback)
+            with open(self.part_path, 'wb') as f:
+                for chunk in r.iter_content(chunk_size=READ_CHUNK):
+                    if chunk:
+                        f.write(chunk)
+                        self._progress.add(len(chunk))
+                        self._count_fetched(len(chunk))
+        if total and os.path.getsize(self.part_path) != total:
+            raise DownloadError(f"Download truncated: {os.path.getsize(self.part_path)} of {total} bytes")
+        staging_dir = f"{self.extract_dir}/.extracting-{os.path.basename(self.zip_path)}"
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        with zipfile.ZipFile(self.part_path) as archive:
+            infos = archive.infolist()
+            for i, info in enumerate(infos):
+                archive.extract(info, staging_dir)
+                if self.progress_callback:
+                    self.progress_callback('extracting', int((i + 1) * 100 / len(infos)), i + 1, len(infos))
+        return staging_dir
+
+    def run(self):
+        """Download, verify and extract. Returns the paths of the extracted top-level entries."""
+        os.makedirs(self.extract_dir, exist_ok=True)
+        self.size, self.etag, ranges = _probe(self.url)
+        start = time.perf_counter()
+        try:
+            if ranges:
+                staging_dir = self._download_parallel()
+            else:
+                logger.info("Server does not support range requests for %s; downloading sequentially", self.url)
+                staging_dir = self._download_sequential()
+        finally:
+            # Includes streaming extraction, which overlaps the transfer
+            elapsed = time.perf_counter() - start
+            DOWNLOAD_SECONDS.inc(elapsed)
+            if self.fetched_bytes and elapsed > 0:
+                DOWNLOAD_THROUGHPUT.set(self.fetched_bytes / elapsed)
+        logger.info("Fetched %d bytes of %s in %.1f s", self.fetched_bytes, self.url, elapsed)
+        if self.size and os.path.getsize(self.part_path) != self.size:
+            raise DownloadError(f"Size mismatch: expected {self.size}, got {os.path.getsize(self.part_path)}")
+        if self.expected_sha256:
+            actual = sha256_file(self.part_path)
+            if actual != self.expected_sha256:
+                # Nothing on disk can be trusted; start from scratch next time
+                for path in (self.part_path, self.state_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+                shutil.rmtree(staging_dir, ignore_errors=True)
+                raise DownloadError(f"Checksum mismatch for {self.url}: {actual}")
+        # Record what a complete install looks like before it becomes visible
+        for name in os.listdir(staging_dir):
+            if os.path.isdir(os.path.join(staging_dir, name)):
+                write_manifest(os.path.join(staging_dir, name))
+        # Move the fully extracted tree into place in one step per top-level entry
+        extracted = []
+        for name in os.listdir(staging_dir):
+            target = os.path.join(self.extract_dir, name)
+            if os.path.isdir(target):
+                shutil.rmtree(target)
+            elif os.path.exists(target):
+                os.remove(target)
+            os.replace(os.path.join(staging_dir, name), target)
+            extracted.append(target)
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        for path in (self.part_path, self.state_path):
+            if os.path.exists(path):
+                os.remove(path)
+        return extracted
+
+def download_and_extract(url, zip_path, extract_dir, progress=None, **kwargs):
+    """
+    Fetch url into zip_path and extract it under extract_dir.
+    progress(status, percent, done, total) is called with status 'downloading'
+    (done/total in bytes) or 'extracting' (done/total in entries).
+    """
+    return SegmentedDownload(url, zip_path, extract_dir, progress=progress, **kwargs).run()
@@ -0,0 +1,69 @@
+"""
+Import-time budget check for the server entry points.
+
+Each module is imported in a fresh interpreter under `python -X importtime`
+(best of --repeat runs). The check fails if a module takes longer than the
+budget, or if importing it pulls in a dependency that must only load on
+first use (spaCy, googletrans, noisereduce, PyAudio, Vosk, requests).
+
+Usage:
+    python import_budget.py [--budget-ms 500] [--repeat 3] [--top 10] [module ...]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+DEFAULT_MODULES = ('app', 'asgi_app', 'download_model')
+# Imported lazily where they are needed; never at startup
+LAZY_DEPENDENCIES = ('spacy', 'googletrans', 'noisereduce', 'pyaudio', 'vosk', 'requests')
+
+def measure(module):
+    """Import module in a fresh interpreter; returns (total_ms, {imported name: cumulative_ms})."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=os.path.dirname(os.path.abspath(__file__)),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{result.stderr[-2000:]}")
+    imports = {}
+    total_ms = None
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        imports[name.strip()] = int(cumulative_us) / 1000.0
+        if name.rstrip() == ' ' + module:  # the top-level entry, not a nested one
+            total_ms = int(cumulative_us) / 1000.0
+    return total_ms, imports
+
+def check(module, budget_ms, repeat=3, top=10):
+    runs = [measure(module) for _ in range(repeat)]
+    total_ms, imports = min(runs, key=lambda run: run[0])
+    leaked = sorted({name.split('.')[0] for name in imports} & set(LAZY_DEPENDENCIES))
+    slowest = sorted(imports.items(), key=lambda item: item[1], reverse=True)
+    slowest = [(name, ms) for name, ms in slowest if name != module][:top]
+    return {'module': module, 'total_ms': total_ms, 'budget_ms': budget_ms,
+            'leaked': leaked, 'slowest': slowest, 'ok': total_ms <= budget_ms and not leaked}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('modules', nargs='*', default=list(DEFAULT_MODULES))
+    parser.add_argument('--budget-ms', type=float, default=500.0, help='Maximum cumulative import time per module')
+    parser.add_argument('--repeat', type=int, default=3, help='Fresh interpreters per module; the fastest counts')
+    parser.add_argument('--top', type=int, default=10, help='Slowest imports to list')
+    args = parser.parse_args(argv)
+
+    failed = False
+    for module in args.modules:
+        report = check(module, args.budget_ms, args.repeat, args.top)
+        status = 'ok' if report['ok'] else 'FAIL'
+        print(f"{module}: {report['total_ms']:.0f} ms (budget {args.budget_ms:.0f} ms) {status}")
+        if report['leaked']:
+            print(f"  imported at startup but should be lazy: {', '.join(report['leaked'])}")
+        for name, ms in report['slowest']:
+            print(f"  {ms:8.1f} ms  {name}")
+        failed = failed or not report['ok']
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,149 @@
+"""
+Concurrent-session load test for the streaming server (Flask or ASGI mode).
+
+Opens N client-fed /stream sessions at once. Each one replays a recording to
+its /ingest URL at real-time pace and measures how long each final result
+takes to arrive after the audio it covers was sent. N is stepped up until
+p95 latency exceeds --max-p95-ms or sessions start failing. The last level
+that stayed under the limit is reported as the server's capacity.
+
+Usage:
+    python load_test.py --url http://127.0.0.1:8000 --audio samples/a.wav
+                        [--lang en] [--levels 1,2,4,8,16,32,64] [--max-p95-ms 1500]
+                        [--output load.json]
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+import requests
+from audio_source import FileAudioSource
+
+# Audio per POST; also the resolution of the latency measurement
+POST_SECONDS = 0.1
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+def _load_pcm(path):
+    source = FileAudioSource(path)
+    source.start()
+    chunks = []
+    while True:
+        data = source.read(int(POST_SECONDS * source.sample_rate))
+        if not data:
+            break
+        chunks.append(data)
+    source.close()
+    return chunks
+
+def run_session(base_url, lang, chunks, result):
+    """One session; fills result with latencies (ms), time to ready and any error."""
+    sent_at = []  # wall time each chunk was POSTed
+    try:
+        started = time.perf_counter()
+        with requests.get(f"{base_url}/stream", params={'lang': lang, 'source': 'client', 'words': '1'},
+                          stream=True, timeout=(10, 120)) as response:
+            response.raise_for_status()
+            lines = response.iter_lines(decode_unicode=True)
+            ready = None
+            for line in lines:
+                if line.startswith('data: '):
+                    ready = json.loads(line[6:])
+                    break
+            if not ready or 'ingest_url' not in ready:
+                raise RuntimeError(f"unexpected first event: {ready}")
+            ready_at = time.perf_counter()
+            result['ready_ms'] = 1000.0 * (ready_at - started)
+
+            def feed():
+                with requests.Session() as http:
+                    for i, chunk in enumerate(chunks):
+                        # Real-time pace against the session's own clock
+                        delay = ready_at + i * POST_SECONDS - time.perf_counter()
+                        if delay > 0:
+                            time.sleep(delay)
+                        last = i == len(chunks) - 1
+                        sent_at.append(time.perf_counter())
+                        http.post(f"{base_url}{ready['ingest_url']}", data=chunk,
+                                  params={'end': '1'} if last else None, timeout=30).raise_for_status()
+
+            feeder = threading.Thread(target=feed, daemon=True)
+            feeder.start()
+            for line in lines:
+                if not line.startswith('data: '):
+                    continue  # keepalive comments
+                event = json.loads(line[6:])
+                if event.get('status') == 'error':
+                    raise RuntimeError(event.get('message'))
+                if 'transcription' not in event:
+                    continue
+                received = time.perf_counter()
+                # The utterance ends with its last word; without timings, with the audio sent so far
+                words = event.get('words') or []
+                index = int(words[-1][2] / POST_SECONDS) if words else len(sent_at) - 1
+                index = min(index, len(sent_at) - 1)
+                if index >= 0:
+                    result['latencies'].append(1000.0 * max(0.0, received - sent_at[index]))
+            feeder.join()
+    except Exception as e:
+        result['error'] = str(e)
+
+def run_level(base_url, lang, chunks, sessions):
+    results = [{'latencies': []} for _ in range(sessions)]
+    threads = [threading.Thread(target=run_session, args=(base_url, lang, chunks, r)) for r in results]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    latencies = [ms for r in results for ms in r['latencies']]
+    ready = [r['ready_ms'] for r in results if 'ready_ms' in r]
+    return {
+        'sessions': sessions,
+        'errors': [r['error'] for r in results if 'error' in r],
+        'results': len(latencies),
+        'latency_ms': {'p50': _percentile(latencies, 50), 'p95': _percentile(latencies, 95),
+                       'max': max(latencies) if latencies else None},
+        'ready_ms_p95': _percentile(ready, 95),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8000', help='Server base URL')
+    parser.add_argument('--audio', required=True, help='WAV or raw 16 kHz mono int16 file to replay')
+    parser.add_argument('--lang', default='en')
+    parser.add_argument('--levels', default='1,2,4,8,16,32,64', help='Concurrent session counts to try')
+    parser.add_argument('--max-p95-ms', type=float, default=1500.0, help='Latency that counts as degraded')
+    parser.add_argument('--output', help='Write the JSON report here (default: stdout)')
+    args = parser.parse_args(argv)
+
+    chunks = _load_pcm(args.audio)
+    base_url = args.url.rstrip('/')
+    levels = []
+    capacity = 0
+    for sessions in (int(n) for n in args.levels.split(',')):
+        print(f"{sessions} concurrent sessions...", file=sys.stderr)
+        level = run_level(base_url, args.lang, chunks, sessions)
+        levels.append(level)
+        p95 = level['latency_ms']['p95']
+        print(f"  p50={level['latency_ms']['p50']} p95={p95} errors={len(level['errors'])}", file=sys.stderr)
+        if level['errors'] or p95 is None or p95 > args.max_p95_ms:
+            break
+        capacity = sessions
+    report = {'url': base_url, 'audio': args.audio, 'lang': args.lang, 'max_p95_ms': args.max_p95_ms,
+              'capacity_sessions': capacity, 'levels': levels}
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    print(f"Sustained {capacity} concurrent sessions under p95 {args.max_p95_ms:.0f} ms", file=sys.stderr)
+    return report
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""
+Process-wide metrics in the Prometheus text exposition format.
+
+A deliberately small subset of the Prometheus client: counters, gauges
+(set directly or computed by a callback at scrape time) and histograms with
+fixed buckets, each optionally labelled. Updates take one lock and a bisect,
+so they are cheap enough for the per-chunk recognition loop. app.py serves
+render() at /metrics.
+"""
+import bisect
+import threading
+
+_registry = []
+_registry_lock = threading.Lock()
+
+# Seconds; spans a single audio chunk up to a slow translation batch
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(name, '') for name in self.labelnames)
+
+    def _items(self):
+        with self._lock:
+            items = list(self._values.items())
+        # An unlabelled series is always exported, starting at zero
+        return items or ([((), 0)] if not self.labelnames else [])
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        return self._header() + [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in self._items()]
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, labelnames=(), callback=None):
+        # callback() returns a number, or a {label_values_tuple: number} dict for labelled gauges
+        super().__init__(name, help_text, labelnames)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self):
+        if self.callback is not None:
+            value = self.callback()
+            items = list(value.items()) if isinstance(value, dict) else [((), value)]
+        else:
+            items = self._items()
+        return self._header() + [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in items]
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # Per-bucket (non-cumulative) counts, then sum and count
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        with self._lock:
+            items = [(k, (list(counts), total, n)) for k, (counts, total, n) in self._values.items()]
+        lines = self._header()
+        for key, (counts, total, n) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', le)])} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {n}")
+        return lines
+
+def render():
+    """All registered metrics as Prometheus text."""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+# -- metrics shared across modules ----------------------------------------------
+
+MODEL_LOAD_SECONDS = Histogram('viberr_model_load_seconds', 'Time to load a Vosk model from disk.',
+                               ['lang'], buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120))
+CHUNK_SECONDS = Histogram('viberr_chunk_processing_seconds',
+                          'Time to gate, denoise and decode one captured audio chunk.')
+DECODE_SECONDS = Histogram('viberr_decode_seconds', 'Time spent in the recognizer per decoded chunk.')
+TRANSLATION_SECONDS = Histogram('viberr_translation_seconds',
+                                'Time from submitting a text for translation to its result.', ['backend'])
+NLP_SECONDS = Histogram('viberr_nlp_seconds',
+                        'Time from submitting a transcript for NLP post-processing to its result.', ['lang'])
+AUDIO_OVERFLOWS = Counter('viberr_audio_overflows_total',
+                          'Times an audio buffer was full and its oldest audio was dropped.', ['source'])
+AUDIO_DROPPED_BYTES = Counter('viberr_audio_dropped_bytes_total', 'Audio bytes dropped on overflow.', ['source'])
+DOWNLOAD_BYTES = Counter('viberr_download_bytes_total', 'Model archive bytes downloaded.')
+DOWNLOAD_SECONDS = Counter('viberr_download_seconds_total', 'Wall time spent downloading model archives.')
+DOWNLOAD_THROUGHPUT = Gauge('viberr_download_throughput_bytes_per_second',
+                            'Throughput of the most recently finished model download.')
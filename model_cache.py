@@ -0,0 +1,204 @@
+"""
+Process-wide cache of loaded Vosk models.
+
+Every language's Model is loaded once and shared by all sessions; a session
+only creates its own (cheap) KaldiRecognizer against it. Models are reference
+counted, and idle ones are evicted least-recently-used first once the
+estimated size of all loaded models exceeds the memory budget.
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from status_registry import publish as publish_status
+from metrics import MODEL_LOAD_SECONDS, Gauge
+
+logger = logging.getLogger(__name__)
+
+# Budget for all resident models, estimated from their size on disk (MB).
+MODEL_MEMORY_BUDGET_MB = int(os.environ.get('VIBERR_MODEL_MEMORY_BUDGET_MB', '8192'))
+
+class _CachedModel:
+    def __init__(self, lang, model, size_bytes):
+        self.lang = lang
+        self.model = model
+        self.size_bytes = size_bytes
+        self.refcount = 0
+
+# model_path -> _CachedModel, ordered from least to most recently used
+_models = OrderedDict()
+# model_path -> Event set once a load in progress finishes (or fails)
+_loading = {}
+_lock = threading.Lock()
+# (model_path, grammar) -> idle recognizers already compiled for that grammar, reused by later sessions
+_grammar_recognizers = {}
+MAX_IDLE_GRAMMAR_RECOGNIZERS = 4
+
+RESIDENT_MODELS = Gauge('viberr_resident_models', 'Vosk models currently loaded.', callback=lambda: len(_models))
+RESIDENT_MODEL_BYTES = Gauge('viberr_resident_model_bytes', 'Estimated size of the loaded Vosk models.',
+                             callback=lambda: sum(e.size_bytes for e in list(_models.values())))
+
+def estimate_model_size(model_path):
+    """Estimate the resident size of a model from the files it is loaded from."""
+    total = 0
+    for root, _dirs, files in os.walk(model_path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+def _evict_idle_locked():
+    """Evict idle models over budget; returns the languages that were unloaded."""
+    budget = MODEL_MEMORY_BUDGET_MB * 1024 * 1024
+    total = sum(entry.size_bytes for entry in _models.values())
+    evicted = []
+    for model_path in list(_models):
+        if total <= budget:
+            break
+        entry = _models[model_path]
+        if entry.refcount > 0:
+            continue
+        logger.info("Evicting idle model for lang=%s (%s)", entry.lang, model_path)
+        del _models[model_path]
+        _drop_grammar_recognizers_locked(model_path)
+        total -= entry.size_bytes
+        evicted.append(entry.lang)
+    return evicted
+
+def _drop_grammar_recognizers_locked(model_path):
+    # Pooled recognizers hold on to their model, so they go with it
+    for key in [key for key in _grammar_recognizers if key[0] == model_path]:
+        del _grammar_recognizers[key]
+
+def _publish_unloaded(langs):
+    for lang in langs:
+        publish_status(lang)
+
+def acquire_model(lang, model_path):
+    """Return the shared Model for model_path, loading it on first use."""
+    while True:
+        with _lock:
+            entry = _models.get(model_path)
+            if entry is not None:
+                entry.refcount += 1
+                _models.move_to_end(model_path)
+                return entry.model
+            pending = _loading.get(model_path)
+            if pending is None:
+                _loading[model_path] = threading.Event()
+                break
+        # Another session is loading this model; wait and look again.
+        pending.wait()
+
+    logger.debug("Loading Vosk Model from path: %s", model_path)
+    start = time.perf_counter()
+    try:
+        from vosk import Model
+        model = Model(model_path)
+    except Exception:
+        with _lock:
+            _loading.pop(model_path).set()
+        raise
+
+    with _lock:
+        entry = _CachedModel(lang, model, estimate_model_size(model_path))
+        entry.refcount = 1
+        _models[model_path] = entry
+        _loading.pop(model_path).set()
+        evicted = _evict_idle_locked()
+    _publish_unloaded(evicted)
+    load_seconds = time.perf_counter() - start
+    MODEL_LOAD_SECONDS.observe(load_seconds, lang=lang)
+    logger.info("Loaded Vosk Model for lang=%s in %.1f s", lang, load_seconds)
+    # Signal that this model has just finished loading
+    from asr import signal_model_loaded
+    signal_model_loaded(lang)
+    return model
+
+def release_model(model_path):
+    """Drop one reference to a model; idle models stay cached until evicted."""
+    with _lock:
+        entry = _models.get(model_path)
+        if entry is None:
+            return
+        entry.refcount = max(0, entry.refcount - 1)
+        _models.move_to_end(model_path)
+        evicted = _evict_idle_locked()
+    _publish_unloaded(evicted)
+
+def warm_model(lang, model_path):
+    """
+    Load model_path in the background unless it is loaded or loading
+    already. It then stays cached, idle, until a session acquires it or it
+    is evicted. Returns whether a load was started.
+    """
+    with _lock:
+        if model_path in _models or model_path in _loading:
+            return False
+
+    def load():
+        try:
+            acquire_model(lang, model_path)
+        except Exception as e:
+            logger.warning("Background load of %s failed: %s", model_path, e)
+            return
+        release_model(model_path)
+
+    threading.Thread(target=load, daemon=True, name='model-warm').start()
+    return True
+
+def create_recognizer(model, sample_rate=16000):
+    """Create a per-session recognizer against a shared model."""
+    from vosk import KaldiRecognizer
+    return KaldiRecognizer(model, sample_rate)
+
+def acquire_grammar_recognizer(model_path, model, grammar, sample_rate=16000):
+    """
+    A recognizer constrained to grammar (a JSON list of phrases, see
+    vocabulary.py). Compiling a grammar is the slow part, so an idle
+    recognizer already built for the same model and grammar is reused.
+    """
+    with _lock:
+        idle = _grammar_recognizers.get((model_path, grammar))
+        if idle:
+            return idle.pop()
+    from vosk import KaldiRecognizer
+    return KaldiRecognizer(model, sample_rate, grammar)
+
+def release_grammar_recognizer(model_path, grammar, recognizer):
+    """Reset a grammar recognizer and keep it for the next session, if its model is still loaded."""
+    recognizer.Reset()
+    with _lock:
+        if model_path not in _models:
+            return
+        idle = _grammar_recognizers.setdefault((model_path, grammar), [])
+        if len(idle) < MAX_IDLE_GRAMMAR_RECOGNIZERS:
+            idle.append(recognizer)
+
+def unload_idle_models():
+    """Unload every cached model that no session is using."""
+    with _lock:
+        idle = [p for p, e in _models.items() if e.refcount == 0]
+        evicted = [_models.pop(model_path).lang for model_path in idle]
+        for model_path in idle:
+            _drop_grammar_recognizers_locked(model_path)
+    _publish_unloaded(evicted)
+
+def is_model_loaded(model_path):
+    with _lock:
+        return model_path in _models
+
+def is_lang_loaded(lang):
+    with _lock:
+        return any(e.lang == lang for e in _models.values())
+
+def get_cache_info():
+    """Return a snapshot of the loaded models, least recently used first."""
+    with _lock:
+        return [
+            {'lang': e.lang, 'model_path': p, 'refcount': e.refcount, 'size_bytes': e.size_bytes}
+            for p, e in _models.items()
+        ]
@@ -0,0 +1,133 @@
+"""
+Per-model manifests and integrity verification.
+
+A manifest (MANIFEST_NAME inside the model directory) is written when an
+archive finishes extracting. It lists every file with its size, SHA-256 and
+modification time. Verification stats each file against it and only rehashes
+files whose mtime changed, so a healthy model verifies in a few stat calls.
+Results are cached per model keyed by the mtimes of the manifest and the
+model directory, making repeated checks O(1).
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+MANIFEST_NAME = '.viberr-manifest.json'
+HASH_WORKERS = 4
+
+# Verification results
+VERIFIED = 'verified'
+UNVERIFIED = 'unverified'   # no manifest (e.g. installed by hand); key files present
+MISSING = 'missing'
+CORRUPT = 'corrupt'
+
+# model_path -> (signature, status, problems)
+_verified = {}
+_lock = threading.Lock()
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _model_files(model_path):
+    for root, _dirs, files in os.walk(model_path):
+        for name in files:
+            if name == MANIFEST_NAME and root == model_path:
+                continue
+            yield os.path.relpath(os.path.join(root, name), model_path)
+
+def write_manifest(model_path, workers=HASH_WORKERS):
+    """Hash every file of an extracted model and write its manifest."""
+    rel_paths = sorted(_model_files(model_path))
+
+    def describe(rel_path):
+        full_path = os.path.join(model_path, rel_path)
+        st = os.stat(full_path)
+        return rel_path, {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha256': _sha256(full_path)}
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        files = dict(pool.map(describe, rel_paths))
+    manifest = {'version': 1, 'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'files': files}
+    tmp_path = os.path.join(model_path, MANIFEST_NAME + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, os.path.join(model_path, MANIFEST_NAME))
+    invalidate(model_path)
+    return manifest
+
+def _has_key_files(model_path):
+    # For most Vosk models, 'am/final.mdl' is a reliable indicator; some only ship model.conf
+    return any(os.path.exists(os.path.join(model_path, *parts))
+               for parts in (('am', 'final.mdl'), ('model.conf',), ('conf', 'model.conf')))
+
+def _signature(model_path):
+    try:
+        manifest_mtime = os.stat(os.path.join(model_path, MANIFEST_NAME)).st_mtime_ns
+    except OSError:
+        manifest_mtime = None
+    return manifest_mtime, os.stat(model_path).st_mtime_ns
+
+def _verify_uncached(model_path, workers):
+    manifest_path = os.path.join(model_path, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        if _has_key_files(model_path):
+            return UNVERIFIED, []
+        return CORRUPT, ['no manifest and no model key files']
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            files = json.load(f)['files']
+    except (OSError, ValueError, KeyError) as e:
+        return CORRUPT, [f"unreadable manifest: {e}"]
+
+    problems = []
+    to_hash = []
+    for rel_path, expected in files.items():
+        try:
+            st = os.stat(os.path.join(model_path, rel_path))
+        except OSError:
+            problems.append(f"{rel_path}: missing")
+            continue
+        if st.st_size != expected['size']:
+            problems.append(f"{rel_path}: size {st.st_size} != {expected['size']}")
+        elif st.st_mtime_ns != expected['mtime_ns']:
+            # Touched since the manifest was written; only the hash can tell
+            to_hash.append(rel_path)
+    if to_hash:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            digests = pool.map(lambda rel: _sha256(os.path.join(model_path, rel)), to_hash)
+            for rel_path, digest in zip(to_hash, digests):
+                if digest != files[rel_path]['sha256']:
+                    problems.append(f"{rel_path}: checksum mismatch")
+    return (CORRUPT if problems else VERIFIED), problems
+
+def verify_model(model_path, workers=HASH_WORKERS):
+    """Return (status, problems) for an installed model, cached until its mtimes change."""
+    if not os.path.isdir(model_path):
+        return MISSING, []
+    signature = _signature(model_path)
+    with _lock:
+        cached = _verified.get(model_path)
+        if cached and cached[0] == signature:
+            return cached[1], cached[2]
+    status, problems = _verify_uncached(model_path, workers)
+    with _lock:
+        _verified[model_path] = (signature, status, problems)
+    return status, problems
+
+def verify_models(model_paths, workers=HASH_WORKERS):
+    """Verify several models in parallel; returns {model_path: (status, problems)}."""
+    with ThreadPoolExecutor(max_workers=max(1, len(model_paths))) as pool:
+        return dict(zip(model_paths, pool.map(lambda path: verify_model(path, workers), model_paths)))
+
+def invalidate(model_path=None):
+    with _lock:
+        if model_path is None:
+            _verified.clear()
+        else:
+            _verified.pop(model_path, None)
@@ -0,0 +1,143 @@
+"""
+NLP post-processing of transcripts: sentences, entities and casing.
+
+Vosk emits lower-case text without punctuation. This stage runs each final
+transcript through the language's spaCy pipeline (asr.NLP_MODELS) to split
+it into sentences, find named entities and restore capitalisation of
+sentence starts, proper nouns and entities.
+
+Pipelines are loaded on first use, at most once per process, with every
+component this stage does not read disabled (the lemmatizer, and the
+parser when the model has a cheaper sentence recognizer). A language whose
+spaCy model is not installed is logged once and passed through.
+
+Live sessions submit transcripts to an NLPStage and get a Future back
+straight away. Its worker collects a micro-batch for up to
+VIBERR_NLP_BATCH_MS (or VIBERR_NLP_BATCH_SIZE texts) and runs it through
+nlp.pipe, so the recognition loop never waits for spaCy. Batch jobs call
+process_texts, which pipes whole lists in fixed-size batches.
+"""
+import logging
+import os
+import threading
+import time
+from batch_stage import MicroBatchStage, shared_stage
+from metrics import NLP_SECONDS
+
+logger = logging.getLogger(__name__)
+
+NLP_BATCH_MS = float(os.environ.get('VIBERR_NLP_BATCH_MS', '50'))
+NLP_BATCH_SIZE = int(os.environ.get('VIBERR_NLP_BATCH_SIZE', '32'))
+
+# Components this stage reads; everything else in a pipeline is disabled
+_USED_COMPONENTS = {'tok2vec', 'transformer', 'tagger', 'morphologizer', 'attribute_ruler',
+                    'senter', 'parser', 'sentencizer', 'ner', 'entity_ruler'}
+# Entity labels that are capitalised (OntoNotes labels for English, WikiNER for the rest)
+_NAME_LABELS = {'PERSON', 'PER', 'ORG', 'GPE', 'LOC', 'NORP', 'FAC', 'EVENT', 'PRODUCT',
+                'WORK_OF_ART', 'LANGUAGE', 'MISC'}
+
+# lang -> loaded pipeline, or None if it could not be loaded
+_pipelines = {}
+_pipelines_lock = threading.Lock()
+
+def _load(lang):
+    import spacy
+    from asr import NLP_MODELS
+    nlp = spacy.load(NLP_MODELS[lang])
+    if 'senter' in nlp.disabled:
+        # Sentence boundaries from the small senter instead of the full dependency parse
+        nlp.enable_pipe('senter')
+        if 'parser' in nlp.pipe_names:
+            nlp.disable_pipe('parser')
+    for name in list(nlp.pipe_names):
+        if name not in _USED_COMPONENTS:
+            nlp.disable_pipe(name)
+    if not any(name in nlp.pipe_names for name in ('senter', 'parser', 'sentencizer')):
+        # e.g. the multilingual NER model: rule-based sentence splitting
+        nlp.add_pipe('sentencizer')
+    return nlp
+
+def load_pipeline(lang):
+    """The spaCy pipeline for lang, loaded once per process; None if it is unavailable."""
+    with _pipelines_lock:
+        if lang in _pipelines:
+            return _pipelines[lang]
+        start = time.perf_counter()
+        try:
+            nlp = _load(lang)
+            logger.info("Loaded NLP pipeline for %s in %.2f s: %s", lang, time.perf_counter() - start,
+                        nlp.pipe_names)
+        except Exception as e:
+            logger.warning("NLP pipeline for %s is unavailable, transcripts pass through: %s", lang, e)
+            nlp = None
+        _pipelines[lang] = nlp
+        return nlp
+
+def _cased_tokens(doc, lang):
+    """Each token's text with capitalisation restored, plus its trailing whitespace."""
+    names = {token.i for ent in doc.ents if ent.label_ in _NAME_LABELS for token in ent}
+    starts = {sent.start for sent in doc.sents}
+    words = []
+    for token in doc:
+        text = token.text
+        if token.i in starts or token.i in names or token.pos_ == 'PROPN' or (lang == 'en' and text == 'i'):
+            text = text[:1].upper() + text[1:]
+        words.append(text + token.whitespace_)
+    return words
+
+def doc_result(doc, lang):
+    """JSON-ready result for a processed transcript; entity offsets index the original text."""
+    words = _cased_tokens(doc, lang)
+    return {
+        'text': ''.join(words),
+        'sentences': [''.join(words[sent.start:sent.end]).strip() for sent in doc.sents],
+        'entities': [[ent.text, ent.label_, ent.start_char, ent.end_char] for ent in doc.ents],
+    }
+
+def process_texts(texts, lang, batch_size=256):
+    """
+    Process a list of transcripts in one language, batch_size at a time;
+    returns one result per text (all None if the pipeline is unavailable).
+    """
+    nlp = load_pipeline(lang)
+    if nlp is None:
+        return [None] * len(texts)
+    return [doc_result(doc, lang) for doc in nlp.pipe(texts, batch_size=batch_size)]
+
+class NLPStage(MicroBatchStage):
+    """Background NLP worker that processes submitted transcripts in time-bounded micro-batches."""
+    name = 'nlp'
+    label = 'NLP'
+
+    def __init__(self, max_queue=256, batch_size=NLP_BATCH_SIZE, max_delay_ms=NLP_BATCH_MS):
+        # spaCy pipelines are not thread-safe; one worker owns them
+        super().__init__(workers=1, max_queue=max_queue, batch_size=batch_size, max_delay_ms=max_delay_ms,
+                         stats=('docs',))
+
+    def submit(self, text, lang):
+        """Queue a transcript; returns a Future for its result (None if it was not processed)."""
+        self._count('requests')
+        if not text or not text.strip():
+            return self._resolved(None)
+        # Never stall the recognition loop; a full queue sends the transcript out unprocessed
+        return self._enqueue(lang, text, None)
+
+    def process(self, text, lang, timeout=None):
+        """Blocking convenience wrapper around submit()."""
+        return self.submit(text, lang).result(timeout)
+
+    def _process_group(self, lang, items):
+        try:
+            results = process_texts([text for text, _future, _submitted in items], lang,
+                                    batch_size=self.batch_size)
+        except Exception as e:
+            logger.warning("NLP error (lang=%s): %s", lang, e)
+            self._count('errors')
+            results = [None] * len(items)
+        self._count('docs', len(items))
+        self._finish(items, results, NLP_SECONDS, lang=lang)
+
+@shared_stage
+def get_nlp_stage():
+    """Process-wide stage shared by all sessions."""
+    return NLPStage()
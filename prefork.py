@@ -0,0 +1,244 @@
+"""
+Pre-fork multi-process server: N cores of decoding for one copy of each model.
+
+The master verifies the installed models and loads the preload languages
+(--preload, default VIBERR_PRELOAD_LANGS) into the model cache. It then
+opens the listening socket and forks the workers. Every worker inherits the
+loaded vosk Models, so their memory is shared copy-on-write, and a session
+in any worker only creates its own KaldiRecognizer. The preloaded models
+keep their cache reference, so no worker ever evicts or reloads them.
+
+All workers accept connections on the shared socket. Sessions live in the
+worker that created them, and their IDs start with that worker's index
+('w3-...'). A request about a session owned by another worker (/ingest/<id>,
+/terminate) is forwarded to the owner's private loopback port.
+
+Model status is shared through the files in VIBERR_STATUS_DIR (a temporary
+folder by default): a model downloaded by one worker is ready in all of
+them, each worker's /status_events clients see the progress of a download
+running in another, and a lock file keeps two workers from fetching the
+same model at once (see status_registry.py).
+
+The master supervises the workers and forks a replacement when one dies.
+Sessions of a dead worker are lost. /sessions and /metrics describe the
+worker that answers the request.
+
+Usage:
+    python prefork.py [--host 0.0.0.0] [--port 5000] [--workers 4] [--preload en,fr]
+                      [--internal-port 5100]
+"""
+import argparse
+import gc
+import http.client
+import io
+import json
+import logging
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import quote
+
+logger = logging.getLogger(__name__)
+
+# Marks a request forwarded between workers, so it is never forwarded again
+ROUTED_HEADER = 'X-Viberr-Routed'
+# A worker that dies sooner than this after starting is restarted after a delay
+MIN_WORKER_SECONDS = 5.0
+RESTART_DELAY_SECONDS = 1.0
+# Hop-by-hop headers that are not copied between the client and the owning worker
+_HOP_HEADERS = {'connection', 'keep-alive', 'transfer-encoding', 'content-length', 'host'}
+
+def worker_prefix(index):
+    return f'w{index}-'
+
+def session_owner(session_id):
+    """Index of the worker that owns session_id, or None if it has no worker prefix."""
+    head, sep, _ = (session_id or '').partition('-')
+    if not sep or not head.startswith('w') or not head[1:].isdigit():
+        return None
+    return int(head[1:])
+
+class SessionRouter:
+    """WSGI middleware that forwards requests about another worker's session to that worker."""
+
+    def __init__(self, app, worker_index, internal_ports, internal_host='127.0.0.1'):
+        self.app = app
+        self.worker_index = worker_index
+        self.internal_ports = internal_ports
+        self.internal_host = internal_host
+
+    def _session_id(self, environ):
+        """The session a request is about, and its buffered body if it had to be read."""
+        path = environ.get('PATH_INFO', '')
+        if path.startswith('/ingest/'):
+            return path[len('/ingest/'):], None
+        if path == '/terminate':
+            from werkzeug.wrappers import Request
+            body = environ['wsgi.input'].read(int(environ.get('CONTENT_LENGTH') or 0))
+            environ['wsgi.input'] = io.BytesIO(body)
+            request = Request(dict(environ, **{'wsgi.input': io.BytesIO(body)}), populate_request=False)
+            session_id = request.values.get('session_id') or (request.get_json(silent=True) or {}).get('session_id')
+            return session_id, body
+        return None, None
+
+    def __call__(self, environ, start_response):
+        if environ.get('HTTP_' + ROUTED_HEADER.upper().replace('-', '_')):
+            return self.app(environ, start_response)
+        session_id, body = self._session_id(environ)
+        owner = session_owner(session_id)
+        if owner is None or owner == self.worker_index or owner >= len(self.internal_ports):
+            return self.app(environ, start_response)
+        return self._forward(environ, start_response, owner, body)
+
+    def _forward(self, environ, start_response, owner, body):
+        from werkzeug.wsgi import get_input_stream
+        headers = {key[5:].replace('_', '-').title(): value for key, value in environ.items()
+                   if key.startswith('HTTP_') and key[5:].replace('_', '-').lower() not in _HOP_HEADERS}
+        if environ.get('CONTENT_TYPE'):
+            headers['Content-Type'] = environ['CONTENT_TYPE']
+        headers[ROUTED_HEADER] = '1'
+        chunked = False
+        if body is None:
+            stream = get_input_stream(environ)
+            if environ.get('CONTENT_LENGTH'):
+                headers['Content-Length'] = environ['CONTENT_LENGTH']
+                body = stream
+            else:
+                # A long-lived chunked upload is relayed chunk by chunk
+                body = iter(lambda: stream.read(8192), b'')
+                chunked = True
+        path = quote(environ.get('PATH_INFO', ''))
+        if environ.get('QUERY_STRING'):
+            path += '?' + environ['QUERY_STRING']
+        conn = http.client.HTTPConnection(self.internal_host, self.internal_ports[owner], timeout=60)
+        try:
+            conn.request(environ['REQUEST_METHOD'], path, body=body, headers=headers, encode_chunked=chunked)
+            response = conn.getresponse()
+            payload = response.read()
+        except OSError as e:
+            # The owner died (and took its sessions with it) or is restarting
+            logger.warning("Worker %d could not reach worker %d: %s", self.worker_index, owner, e)
+            payload = json.dumps({'status': 'error', 'message': 'Unknown or finished session.'}).encode('utf-8')
+            start_response('404 NOT FOUND', [('Content-Type', 'application/json'),
+                                             ('Content-Length', str(len(payload)))])
+            return [payload]
+        finally:
+            conn.close()
+        response_headers = [(k, v) for k, v in response.getheaders() if k.lower() not in _HOP_HEADERS]
+        response_headers.append(('Content-Length', str(len(payload))))
+        start_response(f'{response.status} {response.reason}', response_headers)
+        return [payload]
+
+def _run_worker(index, listener, args, internal_ports):
+    """Worker process body: serve the shared socket plus a private port for forwarded requests."""
+    from werkzeug.serving import make_server
+    import session_manager
+    from app import app
+
+    session_manager.SESSION_ID_PREFIX = worker_prefix(index)
+    internal = make_server('127.0.0.1', internal_ports[index], app, threaded=True)
+    threading.Thread(target=internal.serve_forever, daemon=True, name='internal-server').start()
+    public = make_server(args.host, args.port, SessionRouter(app, index, internal_ports),
+                         threaded=True, fd=listener.fileno())
+    logger.info("Worker %d (pid %d) serving", index, os.getpid())
+    public.serve_forever()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--preload', help='Languages to load before forking (default: VIBERR_PRELOAD_LANGS)')
+    parser.add_argument('--internal-port', type=int, default=5100,
+                        help='First loopback port for worker-to-worker forwarding (one per worker)')
+    args = parser.parse_args(argv)
+
+    if args.preload is not None:
+        os.environ['VIBERR_PRELOAD_LANGS'] = args.preload
+    # Model status (download progress, readiness) is shared by the workers through this folder
+    status_dir = None
+    if not os.environ.get('VIBERR_STATUS_DIR'):
+        status_dir = os.environ['VIBERR_STATUS_DIR'] = tempfile.mkdtemp(prefix='viberr-status-')
+    import app as flask_module
+    from asr import background_downloads
+    # Verification, preloading and the repair downloads they start must finish before forking:
+    # every worker inherits the result, and a thread running during fork() leaves its locks
+    # and half-written files to every child
+    flask_module.start_background_startup().join()
+    for thread in background_downloads():
+        logger.info("Waiting for %s to finish before forking", thread.name)
+        thread.join()
+    others = [thread.name for thread in threading.enumerate() if thread is not threading.current_thread()]
+    if others:
+        logger.error("Threads still running in the master, refusing to fork: %s", ', '.join(others))
+        sys.exit(1)
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((args.host, args.port))
+    listener.listen(128)
+    internal_ports = [args.internal_port + i for i in range(args.workers)]
+    # Keep the master's objects out of the workers' garbage collector, which would otherwise
+    # write to (and so un-share) every page holding them
+    gc.freeze()
+
+    workers = {}  # pid -> (index, started)
+
+    def spawn(index):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                signal.signal(signal.SIGINT, signal.SIG_DFL)
+                _run_worker(index, listener, args, internal_ports)
+            except BaseException:
+                logger.exception("Worker %d crashed", index)
+                code = 1
+            finally:
+                os._exit(code)
+        workers[pid] = (index, time.monotonic())
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for index in range(args.workers):
+        spawn(index)
+    print(f"Serving on http://{args.host}:{args.port} with {args.workers} workers", file=sys.stderr)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        index, started = workers.pop(pid, (None, None))
+        if index is None or stopping:
+            continue
+        logger.warning("Worker %d (pid %d) exited with code %d; restarting",
+                       index, pid, os.waitstatus_to_exitcode(status))
+        if time.monotonic() - started < MIN_WORKER_SECONDS:
+            # Crashing at startup: don't spin
+            time.sleep(RESTART_DELAY_SECONDS)
+        if not stopping:
+            spawn(index)
+    listener.close()
+    if status_dir is not None:
+        shutil.rmtree(status_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,30 @@
 import json
-import pyaudio
+import logging
+import time
 import numpy as np
-import noisereduce as nr
 import threading
-from vosk import Model, KaldiRecognizer
-from translate_util import translate_to_english
+import queue
+from contextlib import contextmanager
+from audio_source import open_microphone
+from denoise import make_denoiser
+from vad import make_vad
+from model_cache import (acquire_model, release_model, create_recognizer, acquire_grammar_recognizer,
+                         release_grammar_recognizer, is_model_loaded, warm_model)
+from tier_policy import MIN_DWELL_SECONDS, TIER_SWITCHES, choose_tier, record_rtf
+from vocabulary import load_grammar
+from translate_util import get_translation_stage
+from nlp_utils import get_nlp_stage
+from metrics import CHUNK_SECONDS, DECODE_SECONDS, Gauge
+
+logger = logging.getLogger(__name__)
 
 # Global registry for running ASR instances
 _running_asr_instances = []
 _running_asr_lock = threading.Lock()
 
+ACTIVE_SESSIONS = Gauge('viberr_active_sessions', 'Recognition sessions currently running.',
+                        callback=lambda: len(_running_asr_instances))
+
 def register_asr_instance(instance):
     with _running_asr_lock:
         _running_asr_instances.append(instance)
@@ -20,127 +35,617 @@ def unregister_asr_instance(instance):
             _running_asr_instances.remove(instance)
 
 def terminate_all_asr_instances():
+    """Stop every running session. Models are released, not unloaded."""
     with _running_asr_lock:
         for instance in list(_running_asr_instances):
             try:
                 instance.terminate()
             except Exception as e:
-                print(f"Error terminating ASR instance: {e}")
+                logger.warning("Error terminating ASR instance: %s", e)
         _running_asr_instances.clear()
 
+# Per-chunk work, as opposed to capture (waiting for audio) or bookkeeping
+CHUNK_STAGES = ('vad', 'denoise', 'decode')
+
+class StageTimer:
+    """
+    Accumulates wall-clock time spent in each stage of the recognition loop.
+    Stages listed in `histograms` are also observed into those metrics.
+    """
+
+    def __init__(self, histograms=None):
+        self.totals = {}
+        self.counts = {}
+        self.histograms = histograms if histograms is not None else {'decode': DECODE_SECONDS}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.totals[name] = self.totals.get(name, 0.0) + elapsed
+            self.counts[name] = self.counts.get(name, 0) + 1
+            histogram = self.histograms.get(name)
+            if histogram is not None:
+                histogram.observe(elapsed)
+
+    def elapsed(self, names=CHUNK_STAGES):
+        """Total time spent so far in the given stages."""
+        return sum(self.totals.get(name, 0.0) for name in names)
+
+    def summary(self):
+        return {
+            name: {'total_s': total, 'count': self.counts[name], 'mean_ms': 1000.0 * total / self.counts[name]}
+            for name, total in self.totals.items()
+        }
+
 class ASR:
-    def __init__(self, lang, model_path, nlp=None, translator=None):
-        print(f"[DEBUG] ASR __init__ called for lang={lang}, model_path={model_path}")
+    def __init__(self, lang, model_path, nlp=None, translator=None, denoise=None, chunk_size=2048,
+                 partials=False, partial_interval_ms=250, words=False, vad=None, vocab=None, tiers=None):
+        logger.debug("ASR __init__ called for lang=%s, model_path=%s", lang, model_path)
+        # Optional grammar: decode only the phrases of a vocabulary (see vocabulary.py)
+        self.vocab = vocab
+        self.grammar = None
+        if vocab:
+            grammar = load_grammar(lang, model_path, vocab)
+            if grammar.supported:
+                self.grammar = grammar
+            else:
+                logger.warning("Model %s cannot take a grammar; decoding vocabulary '%s' with the full graph",
+                               model_path, vocab)
+        # Per-session stage: 'off', 'legacy' or 'streaming' (see denoise.py)
+        self.denoiser = make_denoiser(denoise)
+        # Silence is skipped before denoising and decoding (see vad.py)
+        self.vad = make_vad(vad)
         try:
-            print(f"[DEBUG] ASR __init__: Attempting to load Vosk Model from path: {model_path}")
-            self.model = Model(model_path)
-            print(f"[DEBUG] ASR __init__: Successfully loaded Vosk Model for path: {model_path}")
-            # Signal that this model has just finished loading
-            from asr import signal_model_loaded
-            signal_model_loaded(lang)
+            # Shared across sessions; only loaded from disk on first use
+            self.model = acquire_model(lang, model_path)
         except Exception as e:
-            print(f"[ERROR] ASR __init__: Failed to load Vosk Model from path: {model_path}. Error: {e}")
+            logger.error("ASR __init__: Failed to load Vosk Model from path: %s. Error: %s", model_path, e)
             raise RuntimeError(f"Failed to load Vosk model for language {lang} from path {model_path}") from e
 
-        self.recognizer = KaldiRecognizer(self.model, 16000)
-        print(f"[DEBUG] KaldiRecognizer created for model: {model_path}")
+        self.model_path = model_path
+        try:
+            if self.grammar is not None:
+                self.recognizer = acquire_grammar_recognizer(model_path, self.model, self.grammar.grammar_json)
+            else:
+                self.recognizer = create_recognizer(self.model, 16000)
+        except Exception:
+            # The caller never gets an object to close(); hand the model reference back here
+            del self.model
+            release_model(model_path)
+            raise
+        # Word timings and confidences on final results
+        self.words = words
+        if words or self.grammar is not None:
+            # A reused grammar recognizer keeps the previous session's setting
+            self.recognizer.SetWords(words)
+        logger.debug("KaldiRecognizer created for model: %s", model_path)
+        # tier -> model path; with more than one, the session may change tier between
+        # utterances as server load changes (see tier_policy.py)
+        self.tiers = tiers or {}
+        self.tier = next((tier for tier, path in self.tiers.items() if path == model_path), None)
+        self._tier_since = time.monotonic()
+        # Decode seconds and voiced frames at the last utterance boundary, for the per-utterance RTF
+        self._rtf_mark = (0.0, 0)
         self.lang = lang
         self._terminated = False
-        self.translator = translator
-        self.nlp = nlp
+        self.source = None
+        self.chunk_size = chunk_size
+        self.timer = StageTimer()
+        # Last parsed recognizer result, for callers that want word timings etc.
+        self.last_result = None
+        # Translations run in the background; finished ones are emitted as separate events
+        self.translator = translator or get_translation_stage()
+        self._utterance_id = 0
+        # (utterance_id, event key, Future) for translation and NLP results still to be sent
+        self._pending_followups = []
+        # Opt-in partial hypotheses, sent only when the text changes and at most every interval
+        self.partials = partials
+        self.partial_interval = partial_interval_ms / 1000.0
+        self._last_partial = ''
+        self._last_partial_at = 0.0
+        # Optional post-processing of final transcripts: True for the shared stage, or an NLPStage
+        self.nlp = get_nlp_stage() if nlp is True else nlp
         register_asr_instance(self)
-        print(f"[DEBUG] ASR instance registered for lang={lang}")
+        logger.debug("ASR instance registered for lang=%s", lang)
 
-    def recognize_stream(self):
-        """Generator that yields recognition results. First yield is a ready message."""
-        # This is sent *after* __init__ is complete, so model is loaded.
-        yield {'status': 'ready_and_listening', 'message': f'Model {self.lang.upper()} is loaded and listening.'}
+    def recognize_stream(self, source=None, keepalive_seconds=None):
+        """
+        Generator that yields recognition results. First yield is a ready message.
+        Audio comes from `source` (an audio_source.AudioSource), defaulting to
+        the server's microphone. With keepalive_seconds, {'keepalive': True}
+        is yielded whenever audio kept arriving for that long without an
+        event, e.g. in a quiet room, so the consumer can show the session is
+        alive and find out whether its client still is.
+        """
+        self.source = source or open_microphone()
+        started = False
+        try:
+            # This is sent *after* __init__ is complete, so model is loaded.
+            yield self.ready_event()
 
-        p = pyaudio.PyAudio()
-        stream = p.open(rate=16000, channels=1, format=pyaudio.paInt16, 
-                        input=True, output=False, frames_per_buffer=2048)
-        stream.start_stream()
-        print(f"[DEBUG] PyAudio stream started for lang={self.lang}")
+            self.source.start()
+            started = True
+            logger.debug("Audio source %s started for lang=%s", type(self.source).__name__, self.lang)
 
-        try:
+            last_event = time.monotonic()
             while not self._terminated:
-                data = stream.read(2048, exception_on_overflow=False)
-                if self._terminated or len(data) == 0:
+                with self.timer.stage('capture'):
+                    data = self.source.read(self.chunk_size)
+                if self._terminated:
                     break
-                
-                audio_chunk = np.frombuffer(data, dtype=np.int16)
-                reduced_chunk = nr.reduce_noise(y=audio_chunk, sr=16000, stationary=True, prop_decrease=1.0)
-                data = reduced_chunk.tobytes()
-
-                if self.recognizer.AcceptWaveform(data):
-                    res = json.loads(self.recognizer.Result())
-                    text = res.get("text", "")
-                    if text:
-                        print(f"[DEBUG] ASR result for {self.lang}: {text}")
-                        result_obj = {'transcription': text}
-                        if self.lang != 'en':
-                            translated = translate_to_english(text, self.lang)
-                            print(f"[DEBUG] Translated result for {self.lang}: {translated}")
-                            result_obj['translation'] = translated
-                        else:
-                            result_obj['translation'] = text
-                        yield result_obj
+                if len(data) == 0:
+                    # Source ended on its own: flush the last utterance
+                    yield from self._flush_utterance()
+                    break
+
+                for event in self._process_audio(data):
+                    last_event = time.monotonic()
+                    yield event
+                if keepalive_seconds and time.monotonic() - last_event >= keepalive_seconds:
+                    last_event = time.monotonic()
+                    yield {'keepalive': True}
+            yield from self._finished_followups(wait=not self._terminated)
         finally:
-            print(f"[DEBUG] ASR recognize_stream finally block for lang={self.lang}")
-            stream.stop_stream()
-            stream.close()
-            p.terminate()
-            # Cleanup ASR resources
-            unregister_asr_instance(self)
-            print(f"[DEBUG] ASR instance unregistered for lang={self.lang}")
-            if hasattr(self, 'model'):
-                del self.model
-            if hasattr(self, 'recognizer'):
-                del self.recognizer
-            print(f"[DEBUG] self.model and self.recognizer deleted for lang={self.lang}")
-
-    def listen(self):
-        print(f"[DEBUG] ASR listen called for lang={self.lang}")
-        p = pyaudio.PyAudio()
-        stream = p.open(rate=16000, channels=1, format=pyaudio.paInt16, 
-                        input=True, output=False, frames_per_buffer=2048)
-        stream.start_stream()
-        final_text = ""
-        translated = ""
+            logger.debug("ASR recognize_stream finally block for lang=%s, denoise=%s cpu/s=%.4f, vad=%s",
+                         self.lang, self.denoiser.mode, self.denoiser.cpu_per_audio_second(), self.vad.stats())
+            if started:
+                self.source.close()
+            self.close()
+
+    def ready_event(self):
+        ready = {'status': 'ready_and_listening', 'message': f'Model {self.lang.upper()} is loaded and listening.'}
+        if self.tier:
+            ready['tier'] = self.tier
+        if self.vocab:
+            # Whether the vocabulary is decoded as a grammar, or only requested
+            ready.update(vocab=self.vocab, grammar=self.grammar is not None)
+        return ready
+
+    def feed(self, data):
+        """
+        Push-style alternative to recognize_stream: process one chunk of PCM
+        bytes and return the events it produced. Used by servers that receive
+        audio asynchronously and must not block a thread waiting for it.
+        """
+        return list(self._process_audio(data))
+
+    def poll(self):
+        """Events for translations that finished since the last call; never blocks."""
+        return list(self._finished_followups())
+
+    def finish(self):
+        """Flush the last utterance, wait for outstanding translations and release the session."""
         try:
-            while True:
-                if self._terminated:
-                    print(f"[DEBUG] ASR listen loop terminated for lang={self.lang}")
-                    break
-                data = stream.read(2048, exception_on_overflow=False)
+            return list(self._flush_utterance()) + list(self._finished_followups(wait=True))
+        finally:
+            self.close()
+
+    def _process_audio(self, data):
+        # Stage totals rather than a stopwatch, so time spent by the consumer
+        # of a yielded event is not counted as chunk processing
+        chunk_start = self.timer.elapsed()
+        with self.timer.stage('vad'):
+            voiced, speech_ended = self.vad.process(np.frombuffer(data, dtype=np.int16))
+        for audio_chunk in voiced:
+            yield from self._decode_chunk(audio_chunk)
+        if speech_ended:
+            # Finalize at the end of speech instead of waiting for the decoder's endpointer
+            yield from self._flush_utterance()
+            # The decoder now holds no audio, so this is where the model can change
+            tier_event = self._update_tier()
+            if tier_event:
+                yield tier_event
+        CHUNK_SECONDS.observe(self.timer.elapsed() - chunk_start)
+        yield from self._finished_followups()
+
+    def _decode_chunk(self, audio_chunk):
+        """Denoise and decode one chunk, yielding a final or partial event if there is one."""
+        with self.timer.stage('denoise'):
+            data = self.denoiser.process(audio_chunk).tobytes()
+        with self.timer.stage('decode'):
+            is_final = self.recognizer.AcceptWaveform(data)
+        if is_final:
+            result_obj = self._final_result(self.recognizer.Result())
+            if result_obj:
+                yield result_obj
+        elif self.partials:
+            partial_obj = self._partial_result()
+            if partial_obj:
+                yield partial_obj
+
+    def _flush_utterance(self):
+        with self.timer.stage('decode'):
+            final = self.recognizer.FinalResult()
+        result_obj = self._final_result(final)
+        if result_obj:
+            yield result_obj
+
+    def _update_tier(self):
+        """
+        Record the finished utterance's decode real-time factor, then move the
+        session to the tier the load policy now prefers, if that model is
+        resident. A model that is not is loaded in the background, and the
+        switch happens at a later utterance boundary. Returns a tier event
+        on a switch.
+        """
+        if self.tier is None:
+            return None
+        decode_s = self.timer.totals.get('decode', 0.0)
+        vad = self.vad.stats()
+        audio_s = (vad['frames_processed'] - self._rtf_mark[1]) * vad['frame_ms'] / 1000.0
+        if audio_s > 0:
+            record_rtf(self.tier, (decode_s - self._rtf_mark[0]) / audio_s)
+        self._rtf_mark = (decode_s, vad['frames_processed'])
+        if len(self.tiers) < 2 or self.grammar is not None:
+            return None
+        if time.monotonic() - self._tier_since < MIN_DWELL_SECONDS:
+            return None
+        tier, reason = choose_tier(self.lang, self.tiers, current=self.tier)
+        if tier == self.tier:
+            return None
+        model_path = self.tiers[tier]
+        if not is_model_loaded(model_path):
+            # Loading can take minutes for a large model; never on the recognition loop
+            warm_model(self.lang, model_path)
+            return None
+        try:
+            model = acquire_model(self.lang, model_path)
+        except Exception as e:
+            logger.warning("Could not switch %s session to the %s tier: %s", self.lang, tier, e)
+            return None
+        recognizer = create_recognizer(model, 16000)
+        if self.words:
+            recognizer.SetWords(True)
+        previous_tier, previous_path = self.tier, self.model_path
+        self.model, self.model_path, self.recognizer, self.tier = model, model_path, recognizer, tier
+        release_model(previous_path)
+        self._tier_since = time.monotonic()
+        TIER_SWITCHES.inc(tier=tier)
+        logger.info("Session for %s switched from the %s to the %s tier (%s)", self.lang, previous_tier, tier, reason)
+        return {'tier': tier, 'previous_tier': previous_tier, 'reason': reason}
+
+    def _partial_result(self):
+        """Return a partial event if the hypothesis changed and the throttle allows it."""
+        now = time.monotonic()
+        if now - self._last_partial_at < self.partial_interval:
+            return None
+        self._last_partial_at = now
+        with self.timer.stage('partial'):
+            text = json.loads(self.recognizer.PartialResult()).get('partial', '')
+        if not text or text == self._last_partial:
+            return None
+        self._last_partial = text
+        return {'partial': text}
+
+    def _final_result(self, raw):
+        """Parse a final recognizer result into a result event, or None if empty."""
+        with self.timer.stage('parse'):
+            res = json.loads(raw)
+        self.last_result = res
+        self._last_partial = ''
+        text = res.get("text", "")
+        if not text:
+            return None
+        logger.debug("ASR result for %s: %s", self.lang, text)
+        self._utterance_id += 1
+        result_obj = {'transcription': text, 'utterance_id': self._utterance_id}
+        if self.tier:
+            result_obj['tier'] = self.tier
+        if self.words and res.get('result'):
+            # Compact [word, start_s, end_s, confidence] rows
+            result_obj['words'] = [
+                [w['word'], round(w['start'], 2), round(w['end'], 2), round(w.get('conf', 1.0), 2)]
+                for w in res['result']
+            ]
+        if self.lang != 'en':
+            # Sent later as its own event, see _finished_followups
+            with self.timer.stage('translate'):
+                future = self.translator.submit(text, self.lang)
+            self._pending_followups.append((self._utterance_id, 'translation', future))
+        else:
+            result_obj['translation'] = text
+        if self.nlp is not None:
+            with self.timer.stage('nlp'):
+                future = self.nlp.submit(text, self.lang)
+            self._pending_followups.append((self._utterance_id, 'nlp', future))
+        return result_obj
+
+    def _finished_followups(self, wait=False, timeout=10.0):
+        """Yield translation and NLP events for completed results, in utterance order."""
+        while self._pending_followups:
+            utterance_id, key, future = self._pending_followups[0]
+            if not future.done():
+                if not wait:
+                    return
+                try:
+                    future.result(timeout)
+                except Exception:
+                    pass
+                if not future.done():
+                    return
+            self._pending_followups.pop(0)
+            result = future.result()
+            logger.debug("%s result for %s: %s", key, self.lang, result)
+            if result is not None:
+                yield {'utterance_id': utterance_id, key: result}
+
+    def close(self):
+        """Unregister this session and hand its model reference back to the cache."""
+        unregister_asr_instance(self)
+        if hasattr(self, 'recognizer'):
+            if self.grammar is not None:
+                release_grammar_recognizer(self.model_path, self.grammar.grammar_json, self.recognizer)
+            del self.recognizer
+        if hasattr(self, 'model'):
+            del self.model
+            release_model(self.model_path)
+        logger.debug("ASR instance released for lang=%s", self.lang)
+
+    def terminate(self):
+        logger.debug("ASR terminate called for lang=%s", self.lang)
+        self._terminated = True
+        if self.source is not None:
+            # Wake a read() blocked on client audio
+            self.source.stop()
+
+# Queued to MultiASR decoders when the VAD sees the end of speech
+_SPEECH_END = object()
+
+class MultiASR:
+    """
+    Multi-language session: audio is captured and denoised once, and the same
+    (immutable) chunk is handed to one KaldiRecognizer per language, each
+    decoding in its own worker thread. Per-language results and the current
+    best English text are yielded as they arrive.
+
+    With prune=True each language is scored by the mean confidence of the
+    words it recognizes. Once probe_seconds of audio have been heard, languages
+    trailing the leader by more than prune_margin are dropped (at most `keep`
+    survive) and their decoders and models released, so the session converges
+    on the cost of a single decode. The best English text always comes from
+    the highest-scoring language.
+    """
+
+    def __init__(self, model_paths, denoise=None, chunk_size=2048, translator=None, max_queued_chunks=64,
+                 prune=True, probe_seconds=3.0, keep=2, prune_margin=0.15, min_words=3, vad=None):
+        logger.debug("MultiASR __init__ called for langs=%s", list(model_paths))
+        self.denoiser = make_denoiser(denoise)
+        self.vad = make_vad(vad)
+        self.model_paths = dict(model_paths)
+        self.models = {}
+        self.recognizers = {}
+        try:
+            for lang, model_path in self.model_paths.items():
+                self.models[lang] = acquire_model(lang, model_path)
+            for lang, model in self.models.items():
+                self.recognizers[lang] = create_recognizer(model, 16000)
+                # Per-word confidences drive language scoring
+                self.recognizers[lang].SetWords(True)
+        except Exception as e:
+            self.recognizers.clear()
+            for acquired in self.models:
+                release_model(self.model_paths[acquired])
+            self.models.clear()
+            raise RuntimeError(f"Failed to load Vosk model for language {lang}") from e
+        self.langs = list(self.models)
+        # Languages still being decoded; shrinks as losing languages are pruned
+        self.active = list(self.langs)
+        self.chunk_size = chunk_size
+        self.translator = translator or get_translation_stage()
+        self.prune = prune
+        self.probe_seconds = probe_seconds
+        self.keep = keep
+        self.prune_margin = prune_margin
+        self.min_words = min_words
+        self.timer = StageTimer()
+        self.source = None
+        self._terminated = False
+        self._closed = False
+        self._audio_seconds = 0.0
+        # Bounded per-language queues: a decoder that falls behind slows capture down
+        # rather than growing memory without limit
+        self._queues = {lang: queue.Queue(maxsize=max_queued_chunks) for lang in self.langs}
+        self._events = queue.Queue()
+        self._workers = {}
+        # lang -> (original, translated) for the latest utterance
+        self.results = {lang: ("", "") for lang in self.langs}
+        # lang -> [sum of word confidences, word count]
+        self._confidence = {lang: [0.0, 0] for lang in self.langs}
+        self.best_english = ""
+        self.best_lang = None
+        # Transcriptions whose translation has not come back yet
+        self._pending = 0
+        register_asr_instance(self)
+
+    def _decode_worker(self, lang):
+        recognizer = self.recognizers[lang]
+        chunks = self._queues[lang]
+        while True:
+            data = chunks.get()
+            if lang not in self.active:
+                # Pruned: drop whatever is still queued without decoding it
+                return
+            if data is None:
+                # End of audio: flush the last utterance
+                self._on_final(lang, recognizer.FinalResult())
+                return
+            if data is _SPEECH_END:
+                self._on_final(lang, recognizer.FinalResult())
+                continue
+            start = time.perf_counter()
+            is_final = recognizer.AcceptWaveform(data)
+            DECODE_SECONDS.observe(time.perf_counter() - start)
+            if is_final:
+                self._on_final(lang, recognizer.Result())
+
+    def _on_final(self, lang, raw):
+        result = json.loads(raw)
+        text = result.get("text", "")
+        if not text:
+            return
+        confidences = [w.get("conf", 0.0) for w in result.get("result", [])]
+        logger.debug("MultiASR result for %s: %s", lang, text)
+        self._events.put(('transcription', lang, text, confidences))
+        future = self.translator.submit(text, lang)
+        # A failed translation falls back to the original text so the session never stalls on it
+        future.add_done_callback(lambda f: self._events.put(
+            ('translation', lang, text, text if f.exception() else f.result())))
+
+    def scores(self):
+        """Mean word confidence per language (0.0 until it recognizes anything)."""
+        return {lang: (total / count if count else 0.0) for lang, (total, count) in self._confidence.items()}
+
+    def _select_best_english(self):
+        # English text (translation, else original) of the highest-scoring language
+        # that has a result; word count breaks ties
+        ranked = sorted((lang for lang in self.langs if self.results[lang][0].strip()),
+                        key=lambda lang: (self.scores()[lang], self._confidence[lang][1]), reverse=True)
+        if not ranked:
+            return None, ""
+        orig, trans = self.results[ranked[0]]
+        return ranked[0], trans.strip() if trans and trans.strip() else orig.strip()
+
+    def _maybe_prune(self):
+        """Drop clearly losing languages once enough audio and words have been seen."""
+        if (not self.prune or self._closed or len(self.active) <= 1
+                or self._audio_seconds < self.probe_seconds):
+            return []
+        scores = self.scores()
+        ranked = sorted(self.active, key=lambda lang: scores[lang], reverse=True)
+        leader = ranked[0]
+        if self._confidence[leader][1] < self.min_words:
+            return []
+        survivors = [lang for lang in ranked[:self.keep]
+                     if lang == leader or scores[leader] - scores[lang] <= self.prune_margin]
+        pruned = [lang for lang in ranked if lang not in survivors]
+        for lang in pruned:
+            self._release_language(lang)
+        return pruned
+
+    def _release_language(self, lang):
+        logger.debug("MultiASR pruning lang=%s (score %.2f)", lang, self.scores()[lang])
+        self.active.remove(lang)
+        # Wake the worker so it sees it was pruned, then free its decoder and model
+        self._queues[lang].put(None)
+        self._workers[lang].join()
+        del self.recognizers[lang]
+        del self.models[lang]
+        release_model(self.model_paths[lang])
+
+    def _drain_events(self, timeout=None):
+        """Yield queued result events; with a timeout, wait that long for the first one."""
+        while True:
+            try:
+                event = self._events.get(timeout=timeout) if timeout else self._events.get_nowait()
+            except queue.Empty:
+                return
+            timeout = None
+            if event[0] == 'transcription':
+                _, lang, text, confidences = event
+                self._pending += 1
+                if lang not in self.active:
+                    continue  # Decoded before the language was pruned
+                self.results[lang] = (text, "")
+                self._confidence[lang][0] += sum(confidences)
+                self._confidence[lang][1] += len(confidences)
+                yield {'lang': lang, 'transcription': text}
+                pruned = self._maybe_prune()
+                if pruned:
+                    yield {'pruned': pruned, 'active': list(self.active), 'scores': self.scores()}
+            else:
+                _, lang, text, translated = event
+                self._pending -= 1
+                if lang not in self.active:
+                    continue
+                if self.results[lang][0] == text:
+                    self.results[lang] = (text, translated)
+                yield {'lang': lang, 'transcription': text, 'translation': translated}
+            best_lang, best = self._select_best_english()
+            if best != self.best_english:
+                self.best_lang, self.best_english = best_lang, best
+                yield {'best_english': best, 'lang': best_lang}
+
+    def recognize_stream(self, source=None, keepalive_seconds=None):
+        """
+        Generator of per-language results; first yield is a ready message.
+        keepalive_seconds works as in ASR.recognize_stream.
+        """
+        self.source = source or open_microphone()
+        started = False
+        try:
+            yield {'status': 'ready_and_listening',
+                   'message': f"Models {', '.join(l.upper() for l in self.langs)} are loaded and listening."}
+            for lang in self.langs:
+                worker = threading.Thread(target=self._decode_worker, args=(lang,), daemon=True,
+                                          name=f"decode-{lang}")
+                worker.start()
+                self._workers[lang] = worker
+            self.source.start()
+            started = True
+            last_event = time.monotonic()
+            while not self._terminated:
+                with self.timer.stage('capture'):
+                    data = self.source.read(self.chunk_size)
                 if self._terminated or len(data) == 0:
-                    print(f"[DEBUG] ASR listen loop terminated (no data or terminated) for lang={self.lang}")
                     break
-                audio_chunk = np.frombuffer(data, dtype=np.int16)
-                reduced_chunk = nr.reduce_noise(y=audio_chunk, sr=16000, stationary=True, prop_decrease=1.0)
-                data = reduced_chunk.tobytes()
-                if self.recognizer.AcceptWaveform(data):
-                    res = json.loads(self.recognizer.Result())
-                    final_text = res["text"]
-                    print(f"[DEBUG] ASR result for {self.lang}: {final_text}")
-                    if self.lang != 'en' and final_text:
-                        translated = translate_to_english(final_text, self.lang)
-                        print(f"[DEBUG] Translated result for {self.lang}: {translated}")
-                    else:
-                        translated = final_text
-                # No partial result logic here
+                chunk_start = self.timer.elapsed()
+                with self.timer.stage('vad'):
+                    voiced, speech_ended = self.vad.process(np.frombuffer(data, dtype=np.int16))
+                for audio_chunk in voiced:
+                    with self.timer.stage('denoise'):
+                        # One bytes object shared by every decoder, no per-language copy
+                        data = self.denoiser.process(audio_chunk).tobytes()
+                    self._audio_seconds += len(data) / 2 / 16000
+                    for lang in self.active:
+                        self._queues[lang].put(data)
+                if speech_ended:
+                    for lang in self.active:
+                        self._queues[lang].put(_SPEECH_END)
+                # Decoding happens on the worker threads; this is the capture-side share
+                CHUNK_SECONDS.observe(self.timer.elapsed() - chunk_start)
+                for event in self._drain_events():
+                    last_event = time.monotonic()
+                    yield event
+                if keepalive_seconds and time.monotonic() - last_event >= keepalive_seconds:
+                    last_event = time.monotonic()
+                    yield {'keepalive': True}
         finally:
-            print(f"[DEBUG] ASR listen finally block for lang={self.lang}")
-            stream.stop_stream()
-            stream.close()
-            p.terminate()
-            unregister_asr_instance(self)
-            print(f"[DEBUG] ASR instance unregistered for lang={self.lang}")
-            # Restore del self.model and del self.recognizer
-            del self.model
-            del self.recognizer
-            print(f"[DEBUG] self.model and self.recognizer deleted for lang={self.lang}")
+            for lang in self.active:
+                self._queues[lang].put(None)
+            for worker in self._workers.values():
+                worker.join()
+            if started:
+                self.source.close()
+            self.close()
+        # Flush the final utterances and wait for their translations
+        deadline = time.monotonic() + 10.0
+        yield from self._drain_events()
+        while self._pending and time.monotonic() < deadline:
+            yield from self._drain_events(timeout=max(0.01, deadline - time.monotonic()))
+
+    def listen(self, source=None, on_event=None, keepalive_seconds=None):
+        """Run until the source ends or the session is terminated; returns the final results."""
+        for event in self.recognize_stream(source, keepalive_seconds):
+            if on_event is not None:
+                on_event(event)
+        return {"all_results": dict(self.results), "best_english": self.best_english,
+                "best_lang": self.best_lang, "scores": self.scores()}
+
+    def close(self):
+        self._closed = True
+        unregister_asr_instance(self)
+        self.recognizers = {}
+        for lang in list(self.models):
+            del self.models[lang]
+            release_model(self.model_paths[lang])
+        logger.debug("MultiASR released langs=%s", self.langs)
 
     def terminate(self):
-        print(f"[DEBUG] ASR terminate called for lang={self.lang}")
+        logger.debug("MultiASR terminate called for langs=%s", self.langs)
         self._terminated = True
+        if self.source is not None:
+            self.source.stop()
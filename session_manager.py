@@ -0,0 +1,243 @@
+"""
+Per-session lifecycle: admission control, bookkeeping and idle reaping.
+
+Every recognition session (/stream, /recognize) is admitted here under an
+ID before it loads anything. Admission enforces a global limit and a
+per-language limit on concurrent sessions; a request over the limit waits
+up to VIBERR_SESSION_QUEUE_SECONDS for a slot and is then rejected with a
+retry hint (HTTP 429 + Retry-After in the servers).
+
+A session is active while it sends events (including the keepalives sent
+every KEEPALIVE_SECONDS while a server-microphone session listens to a
+quiet room) or receives client audio. A background reaper terminates
+sessions idle for VIBERR_SESSION_IDLE_SECONDS, which covers clients that
+vanished without the server noticing. The reaper only asks a session to
+stop; its own loop closes the recognizer and source. Termination is always
+by ID, so one client can only end its own session.
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+# 0 disables a limit
+MAX_SESSIONS = int(os.environ.get('VIBERR_MAX_SESSIONS', '32'))
+MAX_SESSIONS_PER_LANG = int(os.environ.get('VIBERR_MAX_SESSIONS_PER_LANG', '8'))
+QUEUE_SECONDS = float(os.environ.get('VIBERR_SESSION_QUEUE_SECONDS', '5'))
+IDLE_SECONDS = float(os.environ.get('VIBERR_SESSION_IDLE_SECONDS', '120'))
+RETRY_AFTER_SECONDS = int(os.environ.get('VIBERR_SESSION_RETRY_SECONDS', '10'))
+REAP_INTERVAL_SECONDS = 5.0
+# Recognition loops with a connected client report activity at least this often, even without speech
+KEEPALIVE_SECONDS = 15.0
+# Prepended to new session IDs; prefork workers set it so any worker can tell which process owns a session
+SESSION_ID_PREFIX = ''
+# A terminated session whose loop has not released it by then gives up its admission slot
+CLOSE_GRACE_SECONDS = 10.0
+
+class SessionLimitError(Exception):
+    """No session slot became free in time; retry after `retry_after` seconds."""
+
+    def __init__(self, message, retry_after=RETRY_AFTER_SECONDS):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class Session:
+    def __init__(self, session_id, langs, kind):
+        self.id = session_id
+        self.langs = tuple(langs)
+        self.kind = kind
+        self.started = time.time()
+        self.last_active = time.monotonic()
+        self.asr = None
+        self.events = 0
+        self.audio_bytes = 0
+        self.terminated = False
+        self.terminated_at = None
+        self.termination_reason = None
+
+    def touch(self, events=0, audio_bytes=0):
+        """Record activity: events sent to the client and/or audio received from it."""
+        self.last_active = time.monotonic()
+        self.events += events
+        self.audio_bytes += audio_bytes
+
+    def terminate(self, reason='terminated'):
+        if self.terminated:
+            return
+        self.terminated = True
+        self.terminated_at = time.monotonic()
+        self.termination_reason = reason
+        if self.asr is not None:
+            self.asr.terminate()
+
+    def usage(self):
+        """Audio processed and time spent on it so far."""
+        usage = {'events': self.events, 'received_audio_bytes': self.audio_bytes}
+        asr = self.asr
+        if asr is not None:
+            vad = asr.vad.stats()
+            audio_seconds = (vad['frames_processed'] + vad['frames_skipped']) * vad['frame_ms'] / 1000.0
+            processing_seconds = asr.timer.elapsed()
+            usage.update({
+                'audio_seconds': round(audio_seconds, 2),
+                'processing_seconds': round(processing_seconds, 3),
+                'realtime_factor': round(processing_seconds / audio_seconds, 4) if audio_seconds else None,
+                'skipped_fraction': round(vad['skipped_fraction'], 3),
+            })
+        return usage
+
+    def info(self):
+        return {
+            'session_id': self.id,
+            'langs': list(self.langs),
+            'kind': self.kind,
+            'started': self.started,
+            'idle_seconds': round(time.monotonic() - self.last_active, 1),
+            'terminated': self.terminated,
+            'termination_reason': self.termination_reason,
+            # Model tier the session decodes with (see tier_policy.py), if it has one
+            'tier': getattr(self.asr, 'tier', None),
+            'usage': self.usage(),
+        }
+
+# session_id -> Session, for every admitted session until it is released
+_sessions = {}
+_cond = threading.Condition()
+_reaper = None
+
+SESSIONS = Gauge('viberr_sessions', 'Admitted recognition sessions by language.', ['lang'],
+                 callback=lambda: _count_by_lang())
+SESSIONS_REJECTED = Counter('viberr_sessions_rejected_total',
+                            'Sessions turned away because a concurrency limit was reached.', ['limit'])
+SESSIONS_REAPED = Counter('viberr_sessions_reaped_total', 'Sessions ended by the reaper.', ['reason'])
+
+def _count_by_lang():
+    with _cond:
+        sessions = list(_sessions.values())
+    counts = {}
+    for session in sessions:
+        for lang in session.langs:
+            counts[(lang,)] = counts.get((lang,), 0) + 1
+    return counts
+
+def _limit_reached_locked(langs):
+    """The limit a new session for langs would exceed ('global' or a language), or None."""
+    if MAX_SESSIONS and len(_sessions) >= MAX_SESSIONS:
+        return 'global'
+    if MAX_SESSIONS_PER_LANG:
+        for lang in langs:
+            if sum(lang in s.langs for s in _sessions.values()) >= MAX_SESSIONS_PER_LANG:
+                return lang
+    return None
+
+def has_capacity(langs):
+    """Whether a session for langs would be admitted right now."""
+    with _cond:
+        return _limit_reached_locked(langs) is None
+
+def admit_session(langs, kind='stream', session_id=None, wait=None):
+    """
+    Register a new session for langs, waiting up to `wait` seconds (default
+    QUEUE_SECONDS, 0 to not wait) for a free slot. Raises SessionLimitError
+    if none frees up in time.
+    """
+    wait = QUEUE_SECONDS if wait is None else wait
+    deadline = time.monotonic() + wait
+    with _cond:
+        while True:
+            limit = _limit_reached_locked(langs)
+            if limit is None:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                SESSIONS_REJECTED.inc(limit=limit)
+                scope = 'concurrent sessions' if limit == 'global' else f'concurrent sessions for {limit}'
+                raise SessionLimitError(f'Too many {scope}; try again shortly.')
+            _cond.wait(remaining)
+        session = Session(session_id or SESSION_ID_PREFIX + uuid.uuid4().hex, langs, kind)
+        _sessions[session.id] = session
+    _ensure_reaper()
+    logger.debug("Admitted %s session %s for langs=%s", kind, session.id, list(langs))
+    return session
+
+def attach_session(session, asr):
+    """Associate the session's ASR (or MultiASR) so it can be terminated and measured."""
+    session.asr = asr
+    if session.terminated:
+        # Terminated while its model was loading
+        asr.terminate()
+
+def release_session(session):
+    """Forget a finished session and wake requests waiting for a slot."""
+    with _cond:
+        if _sessions.get(session.id) is session:
+            del _sessions[session.id]
+            _cond.notify_all()
+    logger.debug("Released session %s (%s)", session.id, session.termination_reason or 'finished')
+
+def get_session(session_id):
+    with _cond:
+        return _sessions.get(session_id)
+
+def terminate_session(session_id, reason='terminated'):
+    """Terminate one session by ID; returns False if there is no such session."""
+    session = get_session(session_id)
+    if session is None:
+        return False
+    session.terminate(reason)
+    return True
+
+def session_count():
+    with _cond:
+        return len(_sessions)
+
+def list_sessions():
+    with _cond:
+        sessions = list(_sessions.values())
+    return [session.info() for session in sessions]
+
+def reap_idle_sessions():
+    """
+    Terminate idle sessions, and free the admission slot of terminated ones
+    whose loop has not released them; returns how many were acted on.
+    """
+    now = time.monotonic()
+    with _cond:
+        sessions = list(_sessions.values())
+    acted = 0
+    for session in sessions:
+        if not session.terminated:
+            if now - session.last_active > IDLE_SECONDS:
+                logger.info("Reaping idle session %s (langs=%s, idle %.0f s)",
+                            session.id, list(session.langs), now - session.last_active)
+                session.terminate('idle')
+                SESSIONS_REAPED.inc(reason='idle')
+                acted += 1
+        elif now - session.terminated_at > CLOSE_GRACE_SECONDS:
+            # e.g. a response generator the server abandoned without closing. Its recognizer may
+            # still be in use on the loop's thread, so only the loop (or its finalizer) closes it
+            logger.info("Releasing session %s that did not shut down after termination", session.id)
+            release_session(session)
+            SESSIONS_REAPED.inc(reason='abandoned')
+            acted += 1
+    return acted
+
+def _reap_loop():
+    while True:
+        time.sleep(REAP_INTERVAL_SECONDS)
+        try:
+            reap_idle_sessions()
+        except Exception:
+            logger.exception("Session reaper failed")
+
+def _ensure_reaper():
+    global _reaper
+    with _cond:
+        if _reaper is not None:
+            return
+        _reaper = threading.Thread(target=_reap_loop, daemon=True, name='session-reaper')
+    _reaper.start()
@@ -1,3 +1,47 @@
 document.addEventListener('DOMContentLoaded', function() {
     console.log('Viberr Trainer loaded');
 });
+
+// Browser microphone capture for /stream?source=client sessions.
+// Audio is downsampled to 16 kHz mono int16 and POSTed, in order, to the session's ingest URL.
+let clientCapture = null;
+
+async function startClientCapture(ingestUrl) {
+    const media = await navigator.mediaDevices.getUserMedia({audio: true});
+    const ctx = new AudioContext();
+    const input = ctx.createMediaStreamSource(media);
+    const processor = ctx.createScriptProcessor(4096, 1, 1);
+    const ratio = ctx.sampleRate / 16000;
+    const capture = {media, ctx, processor, ingestUrl, pending: Promise.resolve()};
+
+    processor.onaudioprocess = function(e) {
+        const samples = e.inputBuffer.getChannelData(0);
+        const pcm = new Int16Array(Math.floor(samples.length / ratio));
+        for (let i = 0; i < pcm.length; i++) {
+            const s = Math.max(-1, Math.min(1, samples[Math.floor(i * ratio)]));
+            pcm[i] = s < 0 ? s * 0x8000 : s * 0x7fff;
+        }
+        // Chain the uploads so chunks reach the server in capture order
+        capture.pending = capture.pending
+            .then(() => fetch(ingestUrl, {
+                method: 'POST',
+                headers: {'Content-Type': 'application/octet-stream'},
+                body: pcm.buffer
+            }))
+            .catch(err => console.error('[clientCapture] Failed to send audio:', err));
+    };
+    input.connect(processor);
+    processor.connect(ctx.destination);
+    clientCapture = capture;
+    console.log(`[clientCapture] Streaming microphone audio to ${ingestUrl}`);
+}
+
+function stopClientCapture() {
+    if (!clientCapture) return;
+    const capture = clientCapture;
+    clientCapture = null;
+    capture.processor.disconnect();
+    capture.media.getTracks().forEach(track => track.stop());
+    capture.ctx.close();
+    capture.pending.then(() => fetch(capture.ingestUrl + '?end=1', {method: 'POST'})).catch(() => {});
+}
@@ -0,0 +1,159 @@
+"""
+In-process registry of model status with push notifications.
+
+Download/extraction progress and model load/unload events are published
+here. Subscribers (the /status_events SSE endpoint) get a queue that
+receives the language code of every change, instead of each browser tab
+polling the filesystem once a second. Readiness checks are cached per
+language and only recomputed after an event for that language.
+
+When VIBERR_STATUS_DIR is set (prefork.py sets it for its workers), every
+event is also recorded as a small file in that folder. That way a download
+finished by one worker process is seen by the others. A cached readiness
+answer is only reused until another event is recorded for it, the latest published
+progress can be read back with shared_state(), and a watcher thread
+forwards other processes' events to this process's subscribers.
+"""
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+
+# Shared between processes when set; None keeps all status in this process
+SHARED_DIR = os.environ.get('VIBERR_STATUS_DIR')
+# How often the watcher looks for events published by other processes
+WATCH_INTERVAL_SECONDS = 0.5
+
+_lock = threading.Lock()
+_subscribers = set()
+# key -> (ready, last shared event for the key when it was computed)
+_readiness = {}
+# Bumped on every event so a readiness check racing an event is not cached
+_generation = {}
+_watcher = None
+_events = itertools.count(1)
+
+def _shared_path(key):
+    return os.path.join(SHARED_DIR, key.replace(':', '.') + '.json')
+
+def _read(key):
+    try:
+        with open(_shared_path(key), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _stamp(key):
+    """Identifies the last event any process recorded for key (None if none or not shared)."""
+    if not SHARED_DIR:
+        return None
+    return _read(key).get('event')
+
+def _record(key, state=None):
+    """Write key's event file with a new event id; state None keeps the recorded state."""
+    os.makedirs(SHARED_DIR, exist_ok=True)
+    if state is None:
+        state = _read(key).get('state')
+    path = _shared_path(key)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'event': f"{os.getpid()}-{next(_events)}", 'state': state}, f)
+    os.replace(tmp_path, path)
+
+def shared_state(key):
+    """The state last published for key by any process, or None."""
+    if not SHARED_DIR:
+        return None
+    return _read(key).get('state')
+
+def _notify(lang):
+    with _lock:
+        subscribers = list(_subscribers)
+    for q in subscribers:
+        try:
+            q.put_nowait(lang)
+        except queue.Full:
+            # Slow client: drop its oldest notification, it only needs the latest state
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                q.put_nowait(lang)
+            except queue.Full:
+                pass
+
+def publish(lang, state=None):
+    """Record a status change for lang (with its new state, if any) and notify subscribers."""
+    with _lock:
+        _readiness.pop(lang, None)
+        _generation[lang] = _generation.get(lang, 0) + 1
+    if SHARED_DIR:
+        _record(lang, state)
+    _notify(lang)
+
+def subscribe(max_pending=64):
+    """Return a queue that receives the language code of each status change."""
+    q = queue.Queue(maxsize=max_pending)
+    with _lock:
+        _subscribers.add(q)
+    if SHARED_DIR:
+        _ensure_watcher()
+    return q
+
+def unsubscribe(q):
+    with _lock:
+        _subscribers.discard(q)
+
+def cached_readiness(lang, check):
+    """Return check(lang), reusing the last answer until an event invalidates it."""
+    stamp = _stamp(lang)
+    with _lock:
+        cached = _readiness.get(lang)
+        if cached is not None and cached[1] == stamp:
+            return cached[0]
+        generation = _generation.get(lang, 0)
+    ready = check(lang)
+    with _lock:
+        if _generation.get(lang, 0) == generation:
+            _readiness[lang] = (ready, stamp)
+    return ready
+
+def invalidate_readiness(lang=None, state=None):
+    with _lock:
+        if lang is None:
+            _readiness.clear()
+        else:
+            _readiness.pop(lang, None)
+            _generation[lang] = _generation.get(lang, 0) + 1
+    if SHARED_DIR and lang is not None:
+        _record(lang, state)
+
+def _watch():
+    """Forward events that other processes recorded in SHARED_DIR to local subscribers."""
+    seen = None
+    own = f"{os.getpid()}-"
+    while True:
+        try:
+            names = [name for name in os.listdir(SHARED_DIR) if name.endswith('.json')]
+        except OSError:
+            names = []
+        events = {name[:-len('.json')]: None for name in names}
+        for key in events:
+            events[key] = _read(key).get('event')
+            # The first pass only takes stock; this process notified its own events already
+            if seen is not None and events[key] != seen.get(key) and not str(events[key]).startswith(own):
+                # Tier keys ('fr.small') notify their language
+                _notify(key.split('.', 1)[0])
+        seen = events
+        time.sleep(WATCH_INTERVAL_SECONDS)
+
+def _ensure_watcher():
+    global _watcher
+    with _lock:
+        if _watcher is not None:
+            return
+        _watcher = threading.Thread(target=_watch, daemon=True, name='status-watcher')
+    _watcher.start()
@@ -0,0 +1,165 @@
+"""
+Load-adaptive choice between a language's model tiers.
+
+Most languages have a 'large' model (the accurate default in
+asr.LANG_MODELS) and a 'small' one (asr.SMALL_LANG_MODELS) that decodes
+several times faster in a fraction of the memory. choose_tier() picks the
+large tier unless the server is under pressure:
+
+- sessions: more admitted sessions than VIBERR_TIER_SESSIONS_PER_CPU per core;
+- rtf: the recent decode real-time factor of large-tier sessions is above
+  VIBERR_TIER_MAX_RTF, i.e. decoding is falling behind the audio;
+- memory: the large model is not loaded and loading it would leave less
+  than VIBERR_TIER_MIN_FREE_MB available, or not fit the model cache budget.
+
+While every session is on the small tier there are no fresh large-tier
+samples. The large RTF is then estimated from the small tier's RTF times
+VIBERR_TIER_LARGE_COST, and the last large-tier measurement only decays
+slowly, so the pressure does not vanish just because it was relieved.
+
+Sessions started with tier=auto re-run the choice between utterances. A
+session moves back to the large tier only once load is RECOVERY_FRACTION
+under the thresholds and no pressure has been seen for
+VIBERR_TIER_UPGRADE_COOLDOWN_SECONDS; new sessions wait out the same
+cooldown. Every session stays on a tier for at least
+VIBERR_TIER_MIN_DWELL_SECONDS, so it does not flap at the boundary.
+VIBERR_MODEL_TIER=small or large pins every session instead.
+"""
+import logging
+import os
+import threading
+import time
+from functools import lru_cache
+from metrics import Counter
+from model_cache import MODEL_MEMORY_BUDGET_MB, estimate_model_size, get_cache_info, is_model_loaded
+from session_manager import session_count
+
+logger = logging.getLogger(__name__)
+
+TIERS = ('small', 'large')
+# 'auto', or a tier every session uses regardless of load
+MODEL_TIER = os.environ.get('VIBERR_MODEL_TIER', 'auto')
+SESSIONS_PER_CPU = float(os.environ.get('VIBERR_TIER_SESSIONS_PER_CPU', '1.0'))
+MAX_RTF = float(os.environ.get('VIBERR_TIER_MAX_RTF', '0.5'))
+MIN_FREE_MB = int(os.environ.get('VIBERR_TIER_MIN_FREE_MB', '2048'))
+MIN_DWELL_SECONDS = float(os.environ.get('VIBERR_TIER_MIN_DWELL_SECONDS', '30'))
+UPGRADE_COOLDOWN_SECONDS = float(os.environ.get('VIBERR_TIER_UPGRADE_COOLDOWN_SECONDS', '60'))
+# How many times slower the large model decodes than the small one
+LARGE_COST = float(os.environ.get('VIBERR_TIER_LARGE_COST', '3.0'))
+RECOVERY_FRACTION = 0.75
+# Weight of the newest utterance in the running RTF, and how long a tier's RTF stays meaningful
+RTF_SMOOTHING = 0.2
+RTF_MAX_AGE_SECONDS = 60.0
+# Half-life of the last large-tier RTF once it is older than RTF_MAX_AGE_SECONDS
+RTF_HALF_LIFE_SECONDS = 300.0
+
+TIER_SWITCHES = Counter('viberr_model_tier_switches_total',
+                        'Sessions moved to another model tier between utterances.', ['tier'])
+
+# tier -> (smoothed decode RTF, monotonic time of the last sample)
+_rtf = {}
+_rtf_lock = threading.Lock()
+# Monotonic time choose_tier last ruled out the large tier
+_last_pressure = None
+
+def record_rtf(tier, rtf):
+    """Fold one utterance's decode real-time factor into the tier's running average."""
+    with _rtf_lock:
+        previous = _rtf.get(tier)
+        if previous is not None and time.monotonic() - previous[1] <= RTF_MAX_AGE_SECONDS:
+            rtf = previous[0] + RTF_SMOOTHING * (rtf - previous[0])
+        _rtf[tier] = (rtf, time.monotonic())
+
+def recent_rtf(tier):
+    """The tier's smoothed decode RTF, or None if no session has used it recently."""
+    with _rtf_lock:
+        value = _rtf.get(tier)
+    if value is None or time.monotonic() - value[1] > RTF_MAX_AGE_SECONDS:
+        return None
+    return value[0]
+
+def large_rtf_estimate():
+    """
+    Decode RTF to expect from the large tier: its recent RTF if sessions use
+    it, otherwise the larger of its last measurement (halving every
+    RTF_HALF_LIFE_SECONDS) and the small tier's RTF times LARGE_COST.
+    """
+    with _rtf_lock:
+        large = _rtf.get('large')
+    if large is not None:
+        age = time.monotonic() - large[1]
+        if age <= RTF_MAX_AGE_SECONDS:
+            return large[0]
+    estimates = []
+    if large is not None:
+        estimates.append(large[0] * 0.5 ** ((age - RTF_MAX_AGE_SECONDS) / RTF_HALF_LIFE_SECONDS))
+    small = recent_rtf('small')
+    if small is not None:
+        estimates.append(small * LARGE_COST)
+    return max(estimates) if estimates else None
+
+def free_memory_mb():
+    """MemAvailable from /proc/meminfo, or None where it cannot be read."""
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) // 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+def load_snapshot():
+    return {
+        'sessions': session_count(),
+        'session_capacity': (os.cpu_count() or 1) * SESSIONS_PER_CPU,
+        'large_rtf': large_rtf_estimate(),
+        'free_mb': free_memory_mb(),
+    }
+
+@lru_cache(maxsize=32)
+def _model_size_mb(model_path):
+    # Walks the model folder; re-evaluated at every utterance boundary, so computed once
+    return estimate_model_size(model_path) / (1024 * 1024)
+
+def _memory_pressure(model_path, load, headroom):
+    if is_model_loaded(model_path):
+        return False
+    size_mb = _model_size_mb(model_path)
+    if load['free_mb'] is not None and load['free_mb'] - size_mb < MIN_FREE_MB / headroom:
+        return True
+    # Models in use cannot be evicted to make room
+    in_use_mb = sum(m['size_bytes'] for m in get_cache_info() if m['refcount']) / (1024 * 1024)
+    return in_use_mb + size_mb > MODEL_MEMORY_BUDGET_MB * headroom
+
+def choose_tier(lang, tiers, current=None):
+    """
+    The tier a session for lang should decode with, out of tiers (tier ->
+    model path, installed ones only), and the reason: 'configured', 'only',
+    'load' for the large tier, the pressure ('sessions', 'rtf', 'memory')
+    that ruled it out, or 'cooldown' while pressure was seen too recently.
+    `current` is the session's tier when re-evaluating.
+    """
+    global _last_pressure
+    if MODEL_TIER in tiers:
+        return MODEL_TIER, 'configured'
+    if len(tiers) == 1 or 'large' not in tiers or 'small' not in tiers:
+        return next(iter(tiers)), 'only'
+    load = load_snapshot()
+    # Going back up needs clear headroom; staying up only needs to be under the limits
+    headroom = RECOVERY_FRACTION if current == 'small' else 1.0
+    reason = None
+    if load['sessions'] > load['session_capacity'] * headroom:
+        reason = 'sessions'
+    elif load['large_rtf'] is not None and load['large_rtf'] > MAX_RTF * headroom:
+        reason = 'rtf'
+    elif _memory_pressure(tiers['large'], load, headroom):
+        reason = 'memory'
+    now = time.monotonic()
+    if reason is not None:
+        _last_pressure = now
+        logger.debug("Model tier for %s: small (%s pressure; load=%s)", lang, reason, load)
+        return 'small', reason
+    if current != 'large' and _last_pressure is not None and now - _last_pressure < UPGRADE_COOLDOWN_SECONDS:
+        return 'small', 'cooldown'
+    return 'large', 'load'
@@ -1,15 +1,176 @@
-from deep_translator import GoogleTranslator
+"""
+Translation helpers.
+
+Translation runs off the recognition loop in a TranslationStage: callers
+submit (text, lang) and get a Future back straight away. A small pool of
+workers drains a bounded queue, batches queued segments per language into
+one request, reuses one client per language and keeps a bounded LRU cache
+of results that can be persisted to disk.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from batch_stage import MicroBatchStage, shared_stage
+from metrics import TRANSLATION_SECONDS
+
+logger = logging.getLogger(__name__)
+
+def _normalize_lang(src_lang):
+    # Normalize language code (e.g., 'en-US' -> 'en')
+    return src_lang.split('-')[0].lower() if src_lang else 'auto'
+
+class GoogleBackend:
+    """Google Translate via deep_translator, one reused client per source language."""
+    name = 'google'
+
+    # Segments are joined with newlines so a batch costs one request
+    separator = '\n'
+
+    def __init__(self):
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def _client(self, src_lang):
+        with self._lock:
+            client = self._clients.get(src_lang)
+            if client is None:
+                from deep_translator import GoogleTranslator
+                client = self._clients[src_lang] = GoogleTranslator(source=src_lang, target='en')
+            return client
+
+    def translate_batch(self, texts, src_lang):
+        client = self._client(src_lang)
+        if len(texts) > 1:
+            joined = client.translate(self.separator.join(texts))
+            parts = joined.split(self.separator) if joined else []
+            if len(parts) == len(texts):
+                return parts
+        # Single segment, or the service merged/split lines: go one by one
+        return [client.translate(text) for text in texts]
+
+class LocalBackend:
+    """Offline stand-in for tests and air-gapped runs; tags text with its language."""
+    name = 'local'
+
+    def translate_batch(self, texts, src_lang):
+        return [f"[{src_lang}] {text}" for text in texts]
+
+TRANSLATION_BACKENDS = {
+    'google': GoogleBackend,
+    'local': LocalBackend,
+}
+
+class TranslationCache:
+    """Bounded LRU of (lang, text) -> translation, optionally persisted as JSON."""
+
+    def __init__(self, max_entries=4096, path=None, save_every=50):
+        self.max_entries = max_entries
+        self.path = path
+        self.save_every = save_every
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._unsaved = 0
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    for lang, text, translated in json.load(f):
+                        self._entries[(lang, text)] = translated
+            except (OSError, ValueError) as e:
+                logger.warning("Could not load translation cache %s: %s", path, e)
+
+    def get(self, lang, text):
+        with self._lock:
+            translated = self._entries.get((lang, text))
+            if translated is not None:
+                self._entries.move_to_end((lang, text))
+            return translated
+
+    def put(self, lang, text, translated):
+        with self._lock:
+            self._entries[(lang, text)] = translated
+            self._entries.move_to_end((lang, text))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._unsaved += 1
+            should_save = self.path and self._unsaved >= self.save_every
+        if should_save:
+            self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            rows = [[lang, text, translated] for (lang, text), translated in self._entries.items()]
+            self._unsaved = 0
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def __len__(self):
+        return len(self._entries)
+
+class TranslationStage(MicroBatchStage):
+    """Background translation workers fed by a bounded queue."""
+    name = 'translate'
+    label = 'Translation'
+
+    def __init__(self, backend=None, workers=2, max_queue=256, batch_size=16, cache=None):
+        self.backend = backend or GoogleBackend()
+        self.backend_name = getattr(self.backend, 'name', type(self.backend).__name__)
+        self.cache = cache if cache is not None else TranslationCache()
+        super().__init__(workers=workers, max_queue=max_queue, batch_size=batch_size,
+                         stats=('cache_hits', 'segments'))
+
+    def submit(self, text, src_lang):
+        """Queue text for translation to English; returns a Future for the result."""
+        src_lang = _normalize_lang(src_lang)
+        self._count('requests')
+        if not text or not text.strip() or src_lang == 'en':
+            return self._resolved(text)
+        cached = self.cache.get(src_lang, text)
+        if cached is not None:
+            self._count('cache_hits')
+            return self._resolved(cached)
+        # Never stall the caller; a full queue falls back to the untranslated text
+        return self._enqueue(src_lang, text, text)
+
+    def translate(self, text, src_lang, timeout=None):
+        """Blocking convenience wrapper around submit()."""
+        return self.submit(text, src_lang).result(timeout)
+
+    def _process_group(self, src_lang, items):
+        # The same segment may be queued twice before the first one is cached
+        texts = list(OrderedDict.fromkeys(text for text, _future, _submitted in items))
+        try:
+            translations = dict(zip(texts, self.backend.translate_batch(texts, src_lang)))
+            for text, translated in translations.items():
+                self.cache.put(src_lang, text, translated)
+        except Exception as e:
+            logger.warning("Translation error (src_lang=%s): %s", src_lang, e)
+            self._count('errors')
+            translations = {}
+        self._count('segments', len(texts))
+        # Fallback to original text if translation fails
+        self._finish(items, [translations.get(text, text) for text, _future, _submitted in items],
+                     TRANSLATION_SECONDS, backend=self.backend_name)
+
+@shared_stage
+def get_translation_stage():
+    """
+    Process-wide stage. VIBERR_TRANSLATOR picks the backend ('google' or
+    'local'); VIBERR_TRANSLATION_CACHE names a JSON file to persist the cache.
+    """
+    backend = TRANSLATION_BACKENDS[os.environ.get('VIBERR_TRANSLATOR', 'google')]()
+    cache = TranslationCache(path=os.environ.get('VIBERR_TRANSLATION_CACHE'))
+    if cache.path:
+        atexit.register(cache.save)
+    return TranslationStage(backend=backend, cache=cache)
 
 def translate_to_english(text, src_lang):
     if not text or not text.strip():
         return text
-    # Normalize language code (e.g., 'en-US' -> 'en')
-    src_lang = src_lang.split('-')[0].lower() if src_lang else 'auto'
-    if src_lang == 'en':
-        return text
-    try:
-        translated = GoogleTranslator(source=src_lang, target='en').translate(text)
-        return translated
-    except Exception as e:
-        print(f"Translation error (src_lang={src_lang}): {e}")
-        return text  # Fallback to original text if translation fails
+    return get_translation_stage().translate(text, src_lang)
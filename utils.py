@@ -1,4 +1,7 @@
 import json
+import logging
+
+logger = logging.getLogger(__name__)
 
 def load_json(file_path):
     """Load a JSON file and return its content."""
@@ -6,6 +9,6 @@ def load_json(file_path):
         with open(file_path, 'r', encoding='utf-8') as file:
             return json.load(file)
     except FileNotFoundError:
-        print(f"file {file_path} was not found.")
+        logger.warning("file %s was not found.", file_path)
     except json.JSONDecodeError:
-        print(f"file {file_path} is not a valid JSON file.")
+        logger.warning("file %s is not a valid JSON file.", file_path)
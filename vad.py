@@ -0,0 +1,132 @@
+"""
+Voice-activity gate in front of denoising and decoding.
+
+Each chunk is split into short frames and classified with two cheap,
+vectorized features: short-term energy against an adaptive noise floor, and
+zero-crossing rate (broadband hiss crosses zero far more often than voiced
+speech). Non-speech chunks are skipped entirely. A hangover keeps the gate
+open for a moment after speech so word endings are not clipped, and a short
+pre-roll of skipped audio is replayed when speech starts so onsets are not
+lost either. When the hangover runs out the gate reports the end of speech,
+so the caller can finalize the utterance immediately.
+
+The gate counts frames skipped versus processed, which is the decode and
+denoise work saved.
+"""
+import os
+from collections import deque
+import numpy as np
+
+VAD_ENABLED = os.environ.get('VIBERR_VAD', '1') != '0'
+
+class VoiceActivityGate:
+    def __init__(self, sr=16000, frame_ms=20, energy_ratio=3.0, min_energy=60.0, max_zcr=0.35,
+                 min_speech_frames=2, hangover_ms=400, preroll_ms=300, noise_adapt=0.05):
+        self.sr = sr
+        self.frame_len = int(sr * frame_ms / 1000)
+        # Speech frames have RMS energy_ratio times the noise floor and at least min_energy
+        self.energy_ratio = energy_ratio
+        self.min_energy = min_energy
+        self.max_zcr = max_zcr
+        self.min_speech_frames = min_speech_frames
+        self.hangover_samples = int(sr * hangover_ms / 1000)
+        self.preroll_samples = int(sr * preroll_ms / 1000)
+        self.noise_adapt = noise_adapt
+        self.noise_floor = None
+        self.in_speech = False
+        self._silence_samples = 0
+        # (chunk, frames) of recent skipped audio, replayed at speech onset
+        self._preroll = deque()
+        self._preroll_len = 0
+        # Counters, in frames of frame_len samples
+        self.frames_processed = 0
+        self.frames_skipped = 0
+
+    def _speech_frames(self, chunk):
+        """Number of frames in chunk classified as speech."""
+        n_frames = len(chunk) // self.frame_len
+        if n_frames == 0:
+            return 0
+        frames = chunk[:n_frames * self.frame_len].reshape(n_frames, self.frame_len).astype(np.float32)
+        rms = np.sqrt(np.mean(frames * frames, axis=1))
+        signs = np.signbit(frames)
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (self.frame_len - 1)
+        if self.noise_floor is None:
+            self.noise_floor = max(float(np.min(rms)), 1.0)
+        threshold = max(self.min_energy, self.noise_floor * self.energy_ratio)
+        speech = (rms > threshold) & (zcr < self.max_zcr)
+        # Track the noise floor on quiet frames only: drop quickly, rise slowly
+        quiet = rms[~speech]
+        if len(quiet):
+            level = float(np.median(quiet))
+            rate = 0.5 if level < self.noise_floor else self.noise_adapt
+            self.noise_floor = max(self.noise_floor + rate * (level - self.noise_floor), 1.0)
+        return int(np.count_nonzero(speech))
+
+    def process(self, chunk):
+        """
+        Gate one int16 chunk. Returns (chunks, speech_ended): the chunks to
+        denoise and decode now (empty while silent; pre-roll plus this chunk at
+        speech onset), and whether speech has just ended.
+        """
+        frames = max(1, len(chunk) // self.frame_len)
+        is_speech = self._speech_frames(chunk) >= self.min_speech_frames
+        if is_speech:
+            self._silence_samples = 0
+            if not self.in_speech:
+                self.in_speech = True
+                # Replayed pre-roll moves from skipped to processed
+                replayed = sum(n for _, n in self._preroll)
+                out = [c for c, _ in self._preroll] + [chunk]
+                self.frames_processed += frames + replayed
+                self.frames_skipped -= replayed
+                self._preroll.clear()
+                self._preroll_len = 0
+                return out, False
+            self.frames_processed += frames
+            return [chunk], False
+        if self.in_speech:
+            self._silence_samples += len(chunk)
+            self.frames_processed += frames
+            if self._silence_samples < self.hangover_samples:
+                return [chunk], False
+            self.in_speech = False
+            return [chunk], True
+        self.frames_skipped += frames
+        self._preroll.append((chunk, frames))
+        self._preroll_len += len(chunk)
+        while self._preroll and self._preroll_len - len(self._preroll[0][0]) >= self.preroll_samples:
+            self._preroll_len -= len(self._preroll.popleft()[0])
+        return [], False
+
+    def stats(self):
+        total = self.frames_processed + self.frames_skipped
+        return {
+            'frames_processed': self.frames_processed,
+            'frames_skipped': self.frames_skipped,
+            'skipped_fraction': self.frames_skipped / total if total else 0.0,
+            'frame_ms': 1000.0 * self.frame_len / self.sr,
+        }
+
+class PassThroughGate:
+    """Stand-in when VAD is disabled: every chunk is processed."""
+
+    def __init__(self, sr=16000, frame_ms=20):
+        self.sr = sr
+        self.frame_len = int(sr * frame_ms / 1000)
+        self.frames_processed = 0
+        self.frames_skipped = 0
+        self.in_speech = True
+
+    def process(self, chunk):
+        self.frames_processed += max(1, len(chunk) // self.frame_len)
+        return [chunk], False
+
+    def stats(self):
+        return {'frames_processed': self.frames_processed, 'frames_skipped': 0, 'skipped_fraction': 0.0,
+                'frame_ms': 1000.0 * self.frame_len / self.sr}
+
+def make_vad(enabled=None, sr=16000):
+    if enabled is None:
+        enabled = VAD_ENABLED
+    return VoiceActivityGate(sr=sr) if enabled else PassThroughGate(sr=sr)
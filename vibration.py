@@ -0,0 +1,82 @@
+"""
+Text to finger-vibration encoding.
+
+Letters map to 5-bit patterns from mappings/binary_map.json (first bit is
+the thumb, last the pinky) and '11111' is the break buzz between words. The
+mapping is compiled once into a lookup table indexed by character code, so
+encoding is one table read per character.
+
+Encoding is a generator of compact frames, [char, mask, on_ms, off_ms], paced
+at a configurable number of characters per second, so a client can start
+vibrating as soon as the first frames of a long utterance arrive.
+"""
+import json
+import os
+import unicodedata
+from functools import lru_cache
+
+MAPPING_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mappings', 'binary_map.json')
+FINGERS = ('thumb', 'index', 'middle', 'ring', 'pinky')
+BREAK = ' '
+DEFAULT_RATE = float(os.environ.get('VIBERR_VIBRATION_CPS', '4'))
+# Above this a frame is shorter than a vibration motor can spin up and stop (on ~15 ms)
+MAX_RATE = 50.0
+
+@lru_cache(maxsize=None)
+def load_lookup(path=MAPPING_PATH):
+    """Return a tuple of 128 masks indexed by ASCII code (-1 for unmapped characters)."""
+    with open(path, 'r', encoding='utf-8') as f:
+        mapping = json.load(f)
+    table = [-1] * 128
+    for char, bits in mapping.items():
+        mask = int(bits, 2)
+        for variant in {char.upper(), char.lower()}:
+            if ord(variant) < 128:
+                table[ord(variant)] = mask
+    return tuple(table)
+
+def mask_to_fingers(mask):
+    """Names of the fingers a mask vibrates, thumb first."""
+    return [name for i, name in enumerate(FINGERS) if mask & (1 << (len(FINGERS) - 1 - i))]
+
+class VibrationEncoder:
+    def __init__(self, rate=None, gap_ratio=0.25, mapping_path=MAPPING_PATH):
+        # rate is in characters per second; gap_ratio of each slot is silence between characters
+        self.rate = rate or DEFAULT_RATE
+        self.on_ms = int(1000.0 / self.rate * (1.0 - gap_ratio))
+        self.off_ms = int(1000.0 / self.rate) - self.on_ms
+        self.table = load_lookup(mapping_path)
+        self.break_mask = self.table[ord(BREAK)]
+
+    def encode(self, text):
+        """Yield [char, mask, on_ms, off_ms] frames for text, one break per run of non-letters."""
+        table = self.table
+        pending_break = False
+        emitted = False
+        for char in text:
+            code = ord(char)
+            if code >= 128:
+                # Accented letters fall back to their base letter (é -> e)
+                char = unicodedata.normalize('NFKD', char)[:1]
+                code = ord(char)
+            mask = table[code] if code < 128 and char != BREAK else -1
+            if mask < 0:
+                pending_break = emitted
+                continue
+            if pending_break:
+                yield [BREAK, self.break_mask, self.on_ms, self.off_ms]
+                pending_break = False
+            yield [char.upper(), mask, self.on_ms, self.off_ms]
+            emitted = True
+
+    def events(self, text, frames_per_event=8, **extra):
+        """Group frames into events for the SSE stream; extra keys (unless None) are added to each event."""
+        extra = {key: value for key, value in extra.items() if value is not None}
+        batch = []
+        for frame in self.encode(text):
+            batch.append(frame)
+            if len(batch) == frames_per_event:
+                yield {'vibration': batch, **extra}
+                batch = []
+        if batch:
+            yield {'vibration': batch, **extra}
@@ -0,0 +1,81 @@
+"""
+Vocabularies for grammar-constrained recognition.
+
+A vocabulary is a JSON list of words or short phrases in data/ (for example
+data/sample_words.json), loaded with utils.load_json. On models with a
+runtime-composed graph (graph/HCLr.fst + graph/Gr.fst, as in the Vosk small
+models) a recognizer can decode against just those phrases plus "[unk]" for
+anything else. That search is far smaller than the full large-vocabulary
+graph, so it is faster and, for trainer sessions, more accurate. Models
+with a precompiled HCLG graph (e.g. gigaspeech) cannot take a grammar;
+sessions on them decode with the full vocabulary.
+
+The grammar for a (language, model, vocabulary) is built once and cached
+until the vocabulary file changes. Phrases with words the model does not
+know are dropped, since the recognizer would ignore them anyway.
+"""
+import json
+import logging
+import os
+import re
+from collections import namedtuple
+from functools import lru_cache
+from utils import load_json
+
+logger = logging.getLogger(__name__)
+
+VOCAB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+UNKNOWN = '[unk]'
+_NAME_RE = re.compile(r'^[A-Za-z0-9_-]+$')
+
+# grammar_json is what KaldiRecognizer takes; dropped lists phrases the model cannot recognize
+Grammar = namedtuple('Grammar', ['vocab', 'grammar_json', 'phrases', 'dropped', 'supported'])
+
+def vocab_path(name):
+    """Path of the vocabulary called name (data/<name>.json), or None if there is none."""
+    if not name or not _NAME_RE.match(name):
+        return None
+    path = os.path.join(VOCAB_DIR, name + '.json')
+    return path if os.path.isfile(path) else None
+
+def supports_grammar(model_path):
+    return os.path.exists(os.path.join(model_path, 'graph', 'HCLr.fst'))
+
+@lru_cache(maxsize=16)
+def _model_words(model_path):
+    """The model's word list, or None if it does not ship one."""
+    path = os.path.join(model_path, 'graph', 'words.txt')
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return frozenset(line.split(None, 1)[0] for line in f if line.strip())
+
+@lru_cache(maxsize=64)
+def _build(lang, model_path, path, mtime):
+    entries = load_json(path)
+    if not isinstance(entries, list):
+        raise ValueError(f"Vocabulary {path} must be a JSON list of words or phrases")
+    known = _model_words(model_path)
+    phrases, dropped, seen = [], [], set()
+    for entry in entries:
+        phrase = ' '.join(str(entry).lower().split())
+        if not phrase or phrase in seen:
+            continue
+        seen.add(phrase)
+        if known is not None and any(word not in known for word in phrase.split()):
+            dropped.append(phrase)
+        else:
+            phrases.append(phrase)
+    if dropped:
+        logger.warning("Vocabulary %s: %d phrase(s) not in the %s model were dropped: %s",
+                       os.path.basename(path), len(dropped), lang, dropped[:10])
+    name = os.path.splitext(os.path.basename(path))[0]
+    return Grammar(name, json.dumps(phrases + [UNKNOWN], ensure_ascii=False), len(phrases), tuple(dropped),
+                   supports_grammar(model_path))
+
+def load_grammar(lang, model_path, name):
+    """The (cached) Grammar for vocabulary name on the model at model_path."""
+    path = vocab_path(name)
+    if path is None:
+        raise ValueError(f"Unknown vocabulary: {name}")
+    return _build(lang, model_path, path, os.path.getmtime(path))